@@ -0,0 +1,236 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from rich import print
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import SyntheticProvider, write_portfolio  # noqa: E402
+from utils.current_asset_value import (  # noqa: E402
+    access_current_asset_value,
+    load_data,
+    provide_breakdown_existing_assets,
+)
+from utils.format_ideal_portfolio import format_ideal_portfolio  # noqa: E402
+from utils.history import read_history  # noqa: E402
+from utils.orders import get_list_of_orders  # noqa: E402
+from utils.planner import build_price_context  # noqa: E402
+from utils.plot_evolution import plot_evolution_value  # noqa: E402
+from utils.price_store import DEFAULT_STORE  # noqa: E402
+from utils.quote_cache import DEFAULT_QUOTES, QuoteCache  # noqa: E402
+
+# Number of leaves and levels of the ideal portfolio, and of transactions of the history
+SCALES = {
+    "small": {"leaves": 10, "depth": 2, "transactions": 1_000},
+    "medium": {"leaves": 1_000, "depth": 3, "transactions": 100_000},
+    "large": {"leaves": 10_000, "depth": 4, "transactions": 1_000_000},
+}
+
+# Timings below this many seconds are too noisy to be flagged as regressions
+NOISE_FLOOR = 0.05
+
+
+class Timer:
+    """Seconds spent in each stage of a scenario"""
+
+    def __init__(self):
+        self.timings = {}
+
+    def __call__(self, stage: str, fn, *args, **kwargs):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        self.timings[stage] = time.perf_counter() - start
+        return result
+
+
+def run_scenario(folder: str, root: str, currency: str = "EUR") -> dict:
+    """Time each stage of a run on the portfolio of `folder`, each download stage from
+    its own empty price store under `root`"""
+    saved = DEFAULT_STORE.root, DEFAULT_STORE.provider
+    DEFAULT_STORE.provider = SyntheticProvider()
+    DEFAULT_QUOTES.clear()
+    try:
+        return _run_stages(folder, root, currency)
+    finally:
+        DEFAULT_STORE.root, DEFAULT_STORE.provider = saved
+        DEFAULT_QUOTES.clear()
+
+
+def _run_stages(folder: str, root: str, currency: str) -> dict:
+    timer = Timer()
+    structure = timer(
+        "format_ideal_portfolio",
+        lambda: format_ideal_portfolio(
+            pd.read_csv(os.path.join(folder, "_ideal_portfolio.csv")), show_tree=False
+        ),
+    )
+    history = timer("read_history", read_history, os.path.join(folder, "_history.csv"))
+
+    # Download of the held assets one by one, into a store of its own
+    DEFAULT_STORE.root = os.path.join(root, "serial")
+    first_date = history["Date"].min()
+    timer(
+        "load_data",
+        lambda: [
+            load_data(ticker, first_date, verbose=False)
+            for ticker in history["yf_name"].unique()
+        ],
+    )
+
+    # Download of everything concurrently, from an empty store again
+    DEFAULT_STORE.root = os.path.join(root, "concurrent")
+    quotes = QuoteCache(DEFAULT_STORE)
+    timer(
+        "quote_fetch",
+        build_price_context,
+        structure,
+        history,
+        currency,
+        history=True,
+        quotes=quotes,
+        verbose=False,
+    )
+
+    assets_breakdown = timer(
+        "provide_breakdown_existing_assets",
+        provide_breakdown_existing_assets,
+        history,
+        0.0,
+        currency,
+        verbose=False,
+        quotes=quotes,
+    )
+    timer(
+        "get_list_of_orders",
+        lambda: (
+            access_current_asset_value(
+                structure, currency, verbose=False, quotes=quotes
+            ),
+            get_list_of_orders(assets_breakdown, structure, currency, verbose=False),
+        ),
+    )
+    timer(
+        "plot_evolution_value",
+        plot_evolution_value,
+        history.copy(),
+        currency,
+        verbose=False,
+        quotes=quotes,
+        output=os.path.join(root, "plot.png"),
+    )
+    return timer.timings
+
+
+def run_benchmarks(scales: list[str], repeat: int = 3, seed: int = 0) -> dict:
+    """Best timing of each stage at each scale over `repeat` runs, each from an empty
+    price store"""
+    results = {}
+    for scale in scales:
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = write_portfolio(
+                os.path.join(tmp, "portfolio"),
+                SCALES[scale]["leaves"],
+                SCALES[scale]["transactions"],
+                depth=SCALES[scale]["depth"],
+                seed=seed,
+            )
+            runs = [
+                run_scenario(folder, os.path.join(tmp, f"data_{i}"))
+                for i in range(repeat)
+            ]
+        results[scale] = {stage: min(r[stage] for r in runs) for stage in runs[0]}
+        print(f"[bold]{scale}[/bold]", SCALES[scale], results[scale])
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.25) -> pd.DataFrame:
+    """Timings of `results` and `baseline` side by side, flagging the stages slower
+    than the baseline by more than `tolerance` (as a fraction)"""
+    rows = [
+        (scale, stage, baseline[scale][stage], seconds)
+        for scale, timings in results.items()
+        for stage, seconds in timings.items()
+        if stage in baseline.get(scale, {})
+    ]
+    table = pd.DataFrame(rows, columns=["scale", "stage", "baseline", "current"])
+    table["ratio"] = table["current"] / table["baseline"]
+    table["regression"] = (table["ratio"] > 1 + tolerance) & (
+        table["current"] > NOISE_FLOOR
+    )
+    return table
+
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+    }
+
+
+def main(argv: list[str] = None):
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Benchmark the stages of a run.")
+    parser.add_argument(
+        "--scales", nargs="+", choices=list(SCALES), default=["small", "medium"]
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output", type=str, default=os.path.join(here, "results.json")
+    )
+    parser.add_argument(
+        "--baseline", type=str, default=os.path.join(here, "baseline.json")
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        help="Slowdown (as a fraction) flagged as a regression",
+        default=0.25,
+    )
+    parser.add_argument(
+        "--save-baseline",
+        default=False,
+        action="store_true",
+        help="Store the results as the new baseline",
+    )
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.scales, repeat=args.repeat, seed=args.seed)
+    report = {"environment": environment(), "results": results}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save-baseline first")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline["environment"] != report["environment"]:
+        print(
+            "[bold yellow]Warning:[/bold yellow] the baseline was measured on",
+            baseline["environment"],
+        )
+    table = compare(results, baseline["results"], args.tolerance)
+    print(table)
+    if table["regression"].any():
+        print("[bold red]Regressions:[/bold red]", table[table["regression"]])
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
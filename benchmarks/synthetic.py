@@ -0,0 +1,130 @@
+import os
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from utils.history import DATE_FORMAT
+from utils.providers import QuoteProvider
+
+CURRENCIES = ["USD", "EUR"]
+
+# First day of the synthetic quotes: the quote of a date never depends on the range
+# requested
+EPOCH = pd.Timestamp("2000-01-03")
+
+
+def ticker_names(n: int) -> list[str]:
+    return [f"T{i:05d}" for i in range(n)]
+
+
+def synthetic_structure(n_leaves: int, depth: int = 2, seed: int = 0) -> pd.DataFrame:
+    """Ideal portfolio of `n_leaves` assets in a tree of `depth` levels, filled like
+    `_ideal_portfolio.csv`: the weight of a category only on its first row"""
+    rng = np.random.default_rng(seed)
+    fanout = max(2, int(np.ceil(n_leaves ** (1 / depth))))
+    leaves = np.arange(n_leaves)
+    tickers = ticker_names(n_leaves)
+    structure = pd.DataFrame(
+        {
+            "Tag": tickers,
+            "Product": [f"Product {t}" for t in tickers],
+            "yf_name": tickers,
+            "Unit": rng.choice(CURRENCIES, n_leaves),
+        }
+    )
+    for level in range(1, depth + 1):
+        node = leaves // fanout ** (depth - level)
+        parent = leaves // fanout ** (depth - level + 1)
+        structure[f"L{level}"] = [f"C{level}-{n}" for n in node]
+
+        # Random weights of the children of each node, summing to 100
+        first = ~pd.Series(node).duplicated().to_numpy()
+        weights = pd.Series(rng.uniform(1, 10, n_leaves)[first], index=node[first])
+        weights = 100 * weights / weights.groupby(parent[first]).transform("sum")
+        structure[f"p_L{level}"] = np.where(first, weights.reindex(node), np.nan)
+    return structure
+
+
+def synthetic_history(
+    n_transactions: int,
+    structure: pd.DataFrame,
+    n_assets: int = 200,
+    years: int = 5,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """Purchase history of `n_transactions` rows over the last `years`, on the first
+    `n_assets` assets of `structure`, formatted like `_history.csv`"""
+    rng = np.random.default_rng(seed)
+    assets = structure.iloc[:n_assets]
+    today = pd.Timestamp.today().normalize()
+    days = pd.bdate_range(today - pd.DateOffset(years=years), today)
+    picked = rng.integers(0, len(assets), n_transactions)
+    quantity = rng.integers(1, 20, n_transactions).astype(float)
+    # One transaction in ten is a partial sell
+    quantity[rng.random(n_transactions) < 0.1] *= -0.1
+    history = pd.DataFrame(
+        {
+            "Date": np.sort(rng.choice(days.to_numpy(), n_transactions)),
+            "yf_name": assets["yf_name"].to_numpy()[picked],
+            "Unit": assets["Unit"].to_numpy()[picked],
+            "Quantity": quantity,
+        }
+    )
+    history["Date"] = history["Date"].dt.strftime(DATE_FORMAT)
+    return history
+
+
+def write_portfolio(
+    folder: str,
+    n_leaves: int,
+    n_transactions: int,
+    depth: int = 2,
+    seed: int = 0,
+) -> str:
+    """Write a synthetic `_ideal_portfolio.csv` and `_history.csv` to `folder`"""
+    os.makedirs(folder, exist_ok=True)
+    structure = synthetic_structure(n_leaves, depth, seed)
+    structure.to_csv(os.path.join(folder, "_ideal_portfolio.csv"), index=False)
+    history = synthetic_history(n_transactions, structure, seed=seed)
+    history.to_csv(os.path.join(folder, "_history.csv"), index=False)
+    return folder
+
+
+class SyntheticProvider(QuoteProvider):
+    """Deterministic quotes: a random walk per ticker, seeded by its name, on every
+    business day since `EPOCH`. Stands in for Yahoo Finance in the benchmarks."""
+
+    def __init__(self, volatility: float = 0.01):
+        self.volatility = volatility
+        # The calendar is shared by all the tickers, built once
+        days = np.arange(
+            EPOCH.to_datetime64(),
+            pd.Timestamp.today().normalize().to_datetime64() + np.timedelta64(1, "D"),
+            np.timedelta64(1, "D"),
+        ).astype("datetime64[D]")
+        self.days = pd.DatetimeIndex(days[np.is_busday(days)].astype("datetime64[ns]"))
+
+    def _close(self, ticker: str) -> pd.Series:
+        # Generated again on each call rather than kept, as cheap as a lookup
+        rng = np.random.default_rng(zlib.crc32(ticker.encode()))
+        # Exchange rates (EURUSD=x, ...) stay around 1, with a tenth of the volatility
+        is_fx = ticker.lower().endswith("=x")
+        level = 1.0 if is_fx else rng.uniform(10, 500)
+        volatility = self.volatility / 10 if is_fx else self.volatility
+        steps = rng.normal(0, volatility, len(self.days))
+        return pd.Series(level * np.exp(np.cumsum(steps)), self.days)
+
+    def history(
+        self, ticker: str, start: pd.Timestamp, end: pd.Timestamp
+    ) -> pd.DataFrame:
+        close = self._close(ticker).loc[start:end]
+        return pd.DataFrame(
+            {
+                "Date": close.index,
+                "Open": close.to_numpy(),
+                "High": close.to_numpy() * 1.01,
+                "Low": close.to_numpy() * 0.99,
+                "Close": close.to_numpy(),
+            }
+        )
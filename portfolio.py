@@ -1,54 +1,810 @@
-import pandas as pd
 import argparse
-from utils.current_asset_value import provide_breakdown_existing_assets
-from utils.orders import get_list_of_orders
-from utils.current_asset_value import access_current_asset_value
-from utils.format_ideal_portfolio import format_ideal_portfolio
-from utils.plot_evolution import plot_evolution_value
+import os
+import sys
+
+import pandas as pd
 from rich import print
+
+from utils.profiler import PROFILER
 # yf.enable_debug_mode()
 
+# The heavy dependencies (yfinance, matplotlib, ...) are only imported by the
+# subcommands that need them, so that e.g. `orders` starts fast
+COMMANDS = [
+    "all",
+    "tree",
+    "breakdown",
+    "orders",
+    "history",
+    "plot",
+    "backtest",
+    "sweep",
+    "serve",
+    "batch",
+    "risk",
+    "pnl",
+    "drift",
+    "whatif",
+    "store",
+]
+
+
+def portfolio_path(args) -> str:
+    """Path of the structure and purchase history"""
+    if args.no_example:
+        return "your_portfolio/"
+    return "example_portfolio/"
+
+
+def load_structure(args) -> pd.DataFrame:
+    """Load the formatted portfolio strategy, and summarize its structure"""
+    from utils.format_ideal_portfolio import format_ideal_portfolio
+
+    with PROFILER.stage("format"):
+        portfolio_structure = pd.read_csv(portfolio_path(args) + "_ideal_portfolio.csv")
+        format_ideal_portfolio(
+            portfolio_structure, show_tree=args.command in ("all", "tree")
+        )
+    return portfolio_structure
+
+
+def load_history(args) -> pd.DataFrame:
+    """Load the purchase history to know the existing portfolio"""
+    from utils.history import read_history
+
+    with PROFILER.stage("history_load"):
+        return read_history(portfolio_path(args) + "_history.csv")
+
+
+def load_holdings(args) -> pd.DataFrame:
+    """Load the quantity held of each asset, without the transactions"""
+    from utils.history import read_holdings
+
+    with PROFILER.stage("history_load"):
+        return read_holdings(portfolio_path(args) + "_history.csv")
+
+
+def load_portfolio(args) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Load the formatted portfolio strategy and the purchase history"""
+    return load_structure(args), load_history(args)
+
+
+def configure_quotes(args):
+    """Read the quotes from local files instead of Yahoo Finance, and the quotes of
+    today from a live cache instead of the daily history, if requested"""
+    from utils.price_store import DEFAULT_STORE
+    from utils.providers import FixtureProvider
+    from utils.quote_cache import DEFAULT_QUOTES
+
+    if args.fixtures is not None:
+        # The fixture quotes get their own store (and snapshots), never mixed with
+        # the quotes downloaded from Yahoo Finance
+        DEFAULT_STORE.root = os.path.join(args.fixtures, ".store")
+        DEFAULT_STORE.provider = FixtureProvider(args.fixtures)
+    if args.live_ttl is not None:
+        from utils.live_quotes import LiveQuotes
+
+        DEFAULT_QUOTES.live = LiveQuotes(DEFAULT_STORE.provider, ttl=args.live_ttl)
+
+
+def price_context(args, portfolio_structure, purchase_history, history: bool):
+    """Fetch every quote and exchange rate needed by the command once"""
+    from utils.planner import build_price_context
+
+    configure_quotes(args)
+    with PROFILER.stage("quote_fetch"):
+        return build_price_context(
+            portfolio_structure,
+            purchase_history,
+            args.currencies,
+            history=history,
+            verbose=args.verbose,
+        )
+
+
+def breakdown(args, purchase_history, quotes) -> pd.DataFrame:
+    from utils.current_asset_value import provide_breakdown_existing_assets
+
+    # Log regarding the change in amount of invested cash
+    if args.investment > 0.0:
+        print(f"{args.investment}{args.currency} added to the portfolio")
+    elif args.investment < 0.0:
+        print(f"{args.investment}{args.currency} removed from the portfolio")
+
+    with PROFILER.stage("breakdown"):
+        return provide_breakdown_existing_assets(
+            purchase_history,
+            args.investment,
+            args.currency,
+            verbose=args.verbose,
+            quotes=quotes,
+            other_currencies=args.currencies[1:],
+        )
+
+
+def run_tree(args):
+    load_structure(args)
+
+
+def run_breakdown(args):
+    holdings = load_holdings(args)
+    quotes = price_context(args, None, holdings, history=False)
+    assets_breakdown = breakdown(args, holdings, quotes)
+    if not args.verbose:
+        print(
+            "Breakdown of each asset in the existing portfolio:\n",
+            assets_breakdown[
+                [
+                    "yf_name",
+                    *[f"position_in_{c}" for c in args.currencies],
+                    "p_overall",
+                    "Quantity",
+                ]
+            ],
+        )
+
+
+def run_orders(args, history: bool = False):
+    from utils.current_asset_value import access_current_asset_value
+    from utils.orders import get_list_of_orders
+
+    portfolio_structure = load_structure(args)
+    # The transactions are only needed to plot the history too
+    purchase_history = load_history(args) if history else load_holdings(args)
+    quotes = price_context(args, portfolio_structure, purchase_history, history)
+    with PROFILER.stage("orders"):
+        access_current_asset_value(
+            portfolio_structure, args.currency, verbose=args.verbose, quotes=quotes
+        )
+    assets_breakdown = breakdown(args, purchase_history, quotes)
+
+    # Get the list of orders to be made to rebalance the portfolio
+    with PROFILER.stage("orders"):
+        get_list_of_orders(
+            assets_breakdown,
+            portfolio_structure,
+            args.currency,
+            min_order=args.min_order,
+            fee_fixed=args.fee_fixed,
+            fee_rate=args.fee_rate,
+            allow_sell=not args.no_sell,
+            max_turnover=args.max_turnover,
+        )
+    return purchase_history, quotes
+
+
+def snapshot(args) -> str | None:
+    """File of the valuation snapshots of the portfolio, unless disabled"""
+    from utils.snapshots import snapshot_path
+
+    if args.no_snapshot:
+        return None
+    return snapshot_path(portfolio_path(args) + "_history.csv", args.currency)
+
+
+def run_history(args):
+    from utils.snapshots import evaluate_with_snapshots
+    from utils.valuation import evaluate_currencies, evaluate_portfolio
+
+    purchase_history = load_history(args)
+    quotes = price_context(args, None, purchase_history, history=True)
+    with PROFILER.stage("valuation"):
+        if len(args.currencies) > 1:
+            df_portfolio_value = evaluate_currencies(
+                purchase_history,
+                args.currencies,
+                quotes=quotes,
+                verbose=args.verbose,
+                dtype=args.dtype,
+            )
+        elif snapshot(args) is not None:
+            df_portfolio_value, _, _ = evaluate_with_snapshots(
+                purchase_history,
+                args.currency,
+                snapshot(args),
+                quotes=quotes,
+                verbose=args.verbose,
+                dtype=args.dtype,
+            )
+        else:
+            df_portfolio_value, _, _ = evaluate_portfolio(
+                purchase_history,
+                args.currency,
+                quotes=quotes,
+                verbose=args.verbose,
+                dtype=args.dtype,
+            )
+    if args.output is not None:
+        df_portfolio_value.to_csv(args.output, index=False)
+    print("Evolution of the portfolio value:\n", df_portfolio_value)
+
+
+def run_plot(args, purchase_history=None, quotes=None):
+    from utils.plot_evolution import plot_evolution_value
+
+    if purchase_history is None:
+        purchase_history = load_history(args)
+        quotes = price_context(args, None, purchase_history, history=True)
+    with PROFILER.stage("plot"):
+        plot_evolution_value(
+            purchase_history.copy(),
+            args.currency,
+            verbose=args.verbose,
+            quotes=quotes,
+            output=args.plot,
+            min_share=args.min_share,
+            snapshot=snapshot(args),
+            dtype=args.dtype,
+        )
+
+
+def run_all(args):
+    purchase_history, quotes = run_orders(args, history=True)
+    run_plot(args, purchase_history, quotes)
+
+
+def _strategy_prices(args) -> tuple[pd.DataFrame, pd.DataFrame]:
+    from utils.backtest import price_history
+
+    portfolio_structure = load_structure(args)
+    configure_quotes(args)
+    with PROFILER.stage("quote_fetch"):
+        prices = price_history(
+            portfolio_structure,
+            args.currency,
+            pd.Timestamp(args.start),
+            verbose=args.verbose,
+            dtype=args.dtype,
+        )
+    return portfolio_structure, prices
+
+
+def run_backtest(args):
+    from utils.backtest import backtest, ideal_weights
+
+    portfolio_structure, prices = _strategy_prices(args)
+    with PROFILER.stage("backtest"):
+        value, turnover, trades = backtest(
+            prices,
+            ideal_weights(portfolio_structure),
+            freq=args.freq,
+            threshold=args.threshold,
+            cost=args.cost,
+        )
+    print(
+        f"Backtest since {args.start}: final value {value.iloc[-1]:.2f} (from 100), "
+        f"{len(turnover)} rebalances, mean turnover {turnover.iloc[1:].mean():.3f}\n",
+        value.resample("YE").last(),
+    )
+    if args.output is not None:
+        pd.concat([value, turnover], axis=1).to_csv(args.output)
+
+
+def run_sweep(args):
+    from utils.sweep import candidate_weights, sweep
+
+    portfolio_structure, prices = _strategy_prices(args)
+    candidates, structures = candidate_weights(
+        portfolio_structure, step=args.step, max_candidates=args.max_candidates
+    )
+    with PROFILER.stage("sweep"):
+        ranked = sweep(
+            prices,
+            candidates,
+            structures,
+            args.output,
+            rank_by=args.rank_by,
+            top=args.top,
+            max_workers=args.workers,
+        )
+    print(f"Best of {len(candidates)} candidate structures:\n", ranked.head(10))
+
+
+def run_risk(args):
+    from utils.backtest import ideal_weights, price_history
+    from utils.risk import correlation, returns_matrix, risk_report
+
+    from utils.quote_cache import DEFAULT_QUOTES
+
+    portfolio_structure, purchase_history = load_portfolio(args)
+
+    # Daily returns of every asset of the real or ideal portfolio, whose history up
+    # to today also gives the current breakdown
+    assets = pd.concat(
+        [
+            portfolio_structure[["yf_name", "Unit"]],
+            purchase_history[["yf_name", "Unit"]],
+        ]
+    ).dropna()
+    configure_quotes(args)
+    with PROFILER.stage("quote_fetch"):
+        prices = price_history(
+            assets,
+            args.currency,
+            pd.Timestamp(args.start),
+            verbose=args.verbose,
+            dtype=args.dtype,
+        )
+    assets_breakdown = breakdown(args, purchase_history, DEFAULT_QUOTES)
+    real = assets_breakdown.set_index("yf_name")["p_overall"].drop(
+        "CASH", errors="ignore"
+    )
+
+    with PROFILER.stage("risk"):
+        returns = returns_matrix(prices)
+        report = risk_report(
+            returns,
+            {"real": real / real.sum(), "ideal": ideal_weights(portfolio_structure)},
+            benchmark="ideal",
+            alpha=args.alpha,
+        )
+    print(f"Risk of the real and ideal portfolios since {args.start}:\n", report.T)
+    if args.verbose:
+        print(
+            "Correlation of the daily returns:\n",
+            pd.DataFrame(
+                correlation(returns), index=returns.columns, columns=returns.columns
+            ).round(2),
+        )
+
+
+def run_pnl(args):
+    from utils.lots import profit_and_loss
+    from utils.valuation import evaluate_portfolio
+
+    purchase_history = load_history(args)
+    quotes = price_context(args, None, purchase_history, history=True)
+    with PROFILER.stage("valuation"):
+        _, _, values = evaluate_portfolio(
+            purchase_history, args.currency, quotes=quotes, verbose=args.verbose
+        )
+    with PROFILER.stage("lots"):
+        realized, unrealized, open_lots = profit_and_loss(
+            purchase_history, values, method=args.method
+        )
+    pnl = pd.DataFrame(
+        {
+            "Date": values.index,
+            "realized_pnl": realized.sum(axis=1).to_numpy(),
+            "unrealized_pnl": unrealized.sum(axis=1).to_numpy(),
+        }
+    )
+    if args.output is not None:
+        pnl.to_csv(args.output, index=False)
+    if args.verbose:
+        print("Open lots:\n", open_lots)
+    print(
+        f"P&L per position ({args.method}):\n",
+        pd.DataFrame(
+            {"realized": realized.iloc[-1], "unrealized": unrealized.iloc[-1]}
+        ).round(2),
+    )
+    print("Evolution of the P&L:\n", pnl)
+
+
+def run_drift(args):
+    from utils.current_asset_value import access_current_asset_value
+    from utils.drift import DriftMonitor, recorded_feed, replay
+
+    portfolio_structure, purchase_history = load_portfolio(args)
+    quotes = price_context(args, portfolio_structure, purchase_history, history=False)
+    access_current_asset_value(
+        portfolio_structure, args.currency, verbose=args.verbose, quotes=quotes
+    )
+    assets_breakdown = breakdown(args, purchase_history, quotes)
+    monitor = DriftMonitor.from_breakdown(
+        assets_breakdown,
+        portfolio_structure,
+        band=args.band,
+        relative_band=args.relative_band,
+    )
+
+    # Replay the recorded quotes since --start on the current positions
+    with PROFILER.stage("quote_fetch"):
+        feed = recorded_feed(
+            monitor.tickers, pd.Timestamp(args.start), quotes, verbose=args.verbose
+        )
+    with PROFILER.stage("drift"):
+        signals = replay({"portfolio": monitor}, feed)
+    print(
+        f"Rebalance signals of the current positions since {args.start}:\n",
+        signals.drop(columns="portfolio").round(2),
+    )
+    print("Current drift of each asset:\n", monitor.weights().round(2))
+
+
+def run_whatif(args):
+    from utils.format_ideal_portfolio import format_ideal_portfolio
+    from utils.whatif import what_if
+
+    portfolio_structure, holdings = load_structure(args), load_holdings(args)
+    structures = {"ideal": portfolio_structure}
+    for path in args.targets:
+        name = os.path.splitext(os.path.basename(path))[0]
+        structures[name] = format_ideal_portfolio(pd.read_csv(path), show_tree=False)
+
+    # One snapshot of the quotes for every scenario
+    quotes = price_context(
+        args, pd.concat(structures.values()), holdings, history=False
+    )
+    with PROFILER.stage("whatif"):
+        scenarios = what_if(
+            holdings,
+            structures,
+            args.investment if args.cash is None else args.cash,
+            args.currency,
+            quotes=quotes,
+            min_order=args.min_order,
+            fee_fixed=args.fee_fixed,
+            fee_rate=args.fee_rate,
+            allow_sell=not args.no_sell,
+            max_turnover=args.max_turnover,
+            verbose=args.verbose,
+        )
+    if args.output is not None:
+        scenarios.to_csv(args.output, index=False)
+    print(
+        "Fees and cash left of each scenario:\n",
+        scenarios.groupby(["target", "cash"], sort=False)[["fees", "cash_left"]]
+        .first()
+        .round(2),
+    )
+
+
+def run_store(args):
+    from utils.price_store import DEFAULT_STORE
+
+    if args.action == "compact":
+        DEFAULT_STORE.compact(verbose=True)
+    else:
+        DEFAULT_STORE.evict(
+            before=args.before, max_idle_days=args.max_idle_days, verbose=True
+        )
+
+
+def run_serve(args):
+    from utils.service import PortfolioService, serve
+
+    configure_quotes(args)
+    service = PortfolioService(
+        portfolio_path(args), args.currency, refresh_interval=args.refresh_interval
+    )
+    serve(service, host=args.host, port=args.port, socket_path=args.socket)
+
+
+def run_batch(args):
+    from utils.batch import find_portfolios, run_batch
+
+    folders = find_portfolios(args.portfolios)
+    if not folders:
+        raise SystemExit(f"No portfolio found in {' '.join(args.portfolios)}")
+    configure_quotes(args)
+    with PROFILER.stage("batch"):
+        run_batch(
+            folders,
+            args.currency,
+            args.output,
+            investment=args.investment,
+            order_options={
+                "min_order": args.min_order,
+                "fee_fixed": args.fee_fixed,
+                "fee_rate": args.fee_rate,
+                "allow_sell": not args.no_sell,
+                "max_turnover": args.max_turnover,
+            },
+            max_workers=args.workers,
+        )
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    # External inputs, shared by every subcommand
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument(
+        "--currency",
+        type=str,
+        help="Currency of reference, or comma-separated currencies to report in, the "
+        "first one being the reference",
+        default="USD",
+    )
+    common.add_argument("--no-example", default=False, action="store_true")
+    common.add_argument("--verbose", default=False, action="store_true")
+    common.add_argument(
+        "--fixtures",
+        type=str,
+        help="Folder of <ticker>.csv histories to use instead of Yahoo Finance (offline)",
+        default=None,
+    )
+    common.add_argument(
+        "--live-ttl",
+        type=float,
+        help="Use intraday quotes for today, refreshed after this many seconds, "
+        "instead of the daily history",
+        default=None,
+    )
+    common.add_argument(
+        "--profile",
+        type=str,
+        nargs="?",
+        const="profile.json",
+        help="Write the duration of each stage and the cache/fetch counters as JSON "
+        "(to profile.json by default, - for the standard output)",
+        default=None,
+    )
+    common.add_argument(
+        "--profile-stats",
+        type=str,
+        help="Also write the cProfile statistics of the run, for pstats",
+        default=None,
+    )
+
+    investment = argparse.ArgumentParser(add_help=False)
+    investment.add_argument(
+        "--investment",
+        type=float,
+        help="Addition/Substraction to the portfolio value in default currency",
+        default=0,
+    )
+
+    orders = argparse.ArgumentParser(add_help=False, parents=[investment])
+    orders.add_argument(
+        "--min-order", type=float, help="Smallest order to pass", default=0
+    )
+    orders.add_argument(
+        "--fee-fixed", type=float, help="Fixed fee per order", default=0
+    )
+    orders.add_argument(
+        "--fee-rate",
+        type=float,
+        help="Fee as a fraction of the traded value",
+        default=0,
+    )
+    orders.add_argument(
+        "--max-turnover",
+        type=float,
+        help="Maximum traded value, as a fraction of the portfolio value",
+        default=None,
+    )
+    orders.add_argument("--no-sell", default=False, action="store_true")
+
+    precision = argparse.ArgumentParser(add_help=False)
+    precision.add_argument(
+        "--dtype",
+        type=str,
+        choices=["float64", "float32"],
+        help="Precision of the price matrices, float32 halving their memory",
+        default="float64",
+    )
+
+    valuation = argparse.ArgumentParser(add_help=False, parents=[precision])
+    valuation.add_argument(
+        "--no-snapshot",
+        default=False,
+        action="store_true",
+        help="Value the whole history again instead of resuming from the last run",
+    )
+
+    plot = argparse.ArgumentParser(add_help=False, parents=[valuation])
+    plot.add_argument(
+        "--plot",
+        type=str,
+        help="File (.png, .svg or .html) to render the plot to, without display",
+        default=None,
+    )
+    plot.add_argument(
+        "--min-share",
+        type=float,
+        help="Positions never weighing more than this are plotted as 'other'",
+        default=0.02,
+    )
+
+    strategy = argparse.ArgumentParser(add_help=False)
+    strategy.add_argument(
+        "--start", type=str, help="First date of the simulation", default="2015-01-01"
+    )
+
+    parser = argparse.ArgumentParser(description="Calculate portfolio breakdown.")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser(
+        "all", parents=[common, orders, plot], help="Tree, orders and plot (default)"
+    )
+    subparsers.add_parser(
+        "tree", parents=[common], help="Structure of the ideal portfolio"
+    )
+    subparsers.add_parser(
+        "breakdown",
+        parents=[common, investment],
+        help="Positions of the existing portfolio",
+    )
+    subparsers.add_parser(
+        "orders", parents=[common, orders], help="Orders to rebalance the portfolio"
+    )
+    history = subparsers.add_parser(
+        "history", parents=[common, valuation], help="Value of the portfolio over time"
+    )
+    history.add_argument("--output", type=str, help="CSV file to write", default=None)
+    subparsers.add_parser(
+        "plot", parents=[common, plot], help="Plot the evolution of the portfolio"
+    )
+
+    backtest = subparsers.add_parser(
+        "backtest",
+        parents=[common, strategy, precision],
+        help="Backtest the ideal portfolio",
+    )
+    backtest.add_argument(
+        "--freq", type=str, help="Rebalancing frequency (W, M, Q, Y)", default="M"
+    )
+    backtest.add_argument(
+        "--threshold",
+        type=float,
+        help="Rebalance when a weight drifts by more than this (instead of --freq)",
+        default=None,
+    )
+    backtest.add_argument(
+        "--cost", type=float, help="Cost as a fraction of the traded value", default=0
+    )
+    backtest.add_argument("--output", type=str, help="CSV file to write", default=None)
+
+    sweep = subparsers.add_parser(
+        "sweep",
+        parents=[common, strategy, precision],
+        help="Search the best p_L1/p_L2 weights",
+    )
+    sweep.add_argument(
+        "--step", type=float, help="Step of the weight grid", default=0.1
+    )
+    sweep.add_argument("--max-candidates", type=int, default=10_000)
+    sweep.add_argument(
+        "--rank-by",
+        type=str,
+        choices=["annual_return", "annual_volatility", "sharpe", "max_drawdown"],
+        default="sharpe",
+    )
+    sweep.add_argument("--top", type=int, default=100)
+    sweep.add_argument("--workers", type=int, default=None)
+    sweep.add_argument("--output", type=str, default="sweep.csv")
+
+    risk = subparsers.add_parser(
+        "risk",
+        parents=[common, investment, strategy, precision],
+        help="Risk of the real portfolio compared to the ideal one",
+    )
+    risk.add_argument(
+        "--alpha", type=float, help="Probability of the Value at Risk", default=0.05
+    )
+
+    pnl = subparsers.add_parser(
+        "pnl",
+        parents=[common],
+        help="Realized and unrealized P&L of the purchase history",
+    )
+    pnl.add_argument(
+        "--method",
+        type=str,
+        choices=["fifo", "lifo", "average"],
+        help="Lots matched by each sell",
+        default="fifo",
+    )
+    pnl.add_argument("--output", type=str, help="CSV file to write", default=None)
+
+    drift = subparsers.add_parser(
+        "drift",
+        parents=[common, investment, strategy],
+        help="Replay the quotes and signal when a weight leaves its band",
+    )
+    drift.add_argument(
+        "--band",
+        type=float,
+        help="Largest drift from the desired weight, in percentage points",
+        default=5.0,
+    )
+    drift.add_argument(
+        "--relative-band",
+        type=float,
+        help="Largest drift, as a fraction of the desired weight (if smaller)",
+        default=None,
+    )
+
+    whatif = subparsers.add_parser(
+        "whatif",
+        parents=[common, orders],
+        help="Orders for many cash influxes and ideal portfolios at once",
+    )
+    whatif.add_argument(
+        "--cash",
+        type=float,
+        nargs="+",
+        help="Cash influxes to evaluate (default: --investment)",
+        default=None,
+    )
+    whatif.add_argument(
+        "--targets",
+        type=str,
+        nargs="*",
+        help="Other ideal portfolio files to evaluate, besides the portfolio's one",
+        default=[],
+    )
+    whatif.add_argument("--output", type=str, help="CSV file to write", default=None)
+
+    store = subparsers.add_parser(
+        "store",
+        parents=[common],
+        help="Fold the legacy CSV quotes into the price store, or evict old quotes",
+    )
+    store.add_argument("action", choices=["compact", "evict"])
+    store.add_argument(
+        "--before", type=str, help="Drop the quotes older than this date", default=None
+    )
+    store.add_argument(
+        "--max-idle-days",
+        type=int,
+        help="Drop the tickers not downloaded for this many days",
+        default=None,
+    )
+
+    serve = subparsers.add_parser(
+        "serve",
+        parents=[common],
+        help="Answer breakdown, orders and valuation queries over HTTP",
+    )
+    serve.add_argument("--host", type=str, default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument(
+        "--socket", type=str, help="Unix socket to listen on instead", default=None
+    )
+    serve.add_argument(
+        "--refresh-interval",
+        type=float,
+        help="Seconds between two downloads of the latest quotes",
+        default=900,
+    )
+
+    batch = subparsers.add_parser(
+        "batch",
+        parents=[common, orders],
+        help="Breakdown and orders of many portfolios at once",
+    )
+    batch.add_argument(
+        "portfolios", nargs="+", help="Portfolio folders, or glob patterns of them"
+    )
+    batch.add_argument(
+        "--output",
+        type=str,
+        help="Prefix of the <prefix>_breakdown.csv and <prefix>_orders.csv files",
+        default="batch",
+    )
+    batch.add_argument("--workers", type=int, default=None)
+
+    # Without subcommand, do everything as before
+    if not any(arg in COMMANDS or arg in ("-h", "--help") for arg in argv):
+        argv = ["all"] + argv
+    args = parser.parse_args(argv)
+    # Every command computes in the first currency, some also report in the others
+    args.currencies = list(dict.fromkeys(args.currency.split(",")))
+    args.currency = args.currencies[0]
+    return args
+
+
+def main(argv: list[str] = None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    run = globals()[f"run_{args.command}"]
+    if args.profile is None and args.profile_stats is None:
+        return run(args)
+
+    import cProfile
+
+    PROFILER.start()
+    profile = cProfile.Profile() if args.profile_stats is not None else None
+    try:
+        if profile is None:
+            run(args)
+        else:
+            profile.runcall(run, args)
+    finally:
+        if profile is not None:
+            profile.dump_stats(args.profile_stats)
+        PROFILER.dump(args.profile or "-")
+
 
-# External inputs
-parser = argparse.ArgumentParser(description="Calculate portfolio breakdown.")
-parser.add_argument(
-    "--investment",
-    type=float,
-    help="Addition/Substraction to the portfolio value in default currency",
-    default=0,
-)
-parser.add_argument("--currency", type=str, help="Currency of reference", default="USD")
-parser.add_argument("--no-example", default=False, action="store_true")
-parser.add_argument("--verbose", default=False, action="store_true")
-args = parser.parse_args()
-
-# Path of the structure and purchase history
-if args.no_example:
-    path_portfolio = "your_portfolio/"
-else:
-    path_portfolio = "example_portfolio/"
-
-# Log regarding the change in amount of invested cash
-if args.investment > 0.0:
-    print(f"{args.investment}{args.currency} added to the portfolio")
-elif args.investment < 0.0:
-    print(f"{args.investment}{args.currency} removed from the portfolio")
-
-# Load the portfolio and its strategy
-portfolio_structure = pd.read_csv(path_portfolio + "_ideal_portfolio.csv")
-
-# Summarize the structure of the portfolio
-format_ideal_portfolio(portfolio_structure)
-access_current_asset_value(portfolio_structure, args.currency, verbose=args.verbose)
-
-# Load the purchase history to know the existing portfolio
-purchase_history = pd.read_csv(path_portfolio + "_history.csv")
-assets_breakdown = provide_breakdown_existing_assets(
-    purchase_history, args.investment, args.currency, verbose=args.verbose
-)
-
-# Get the list of orders to be made to rebalance the portfolio
-get_list_of_orders(assets_breakdown, portfolio_structure, args.currency)
-
-
-plot_evolution_value(purchase_history.copy(), args.currency, verbose=args.verbose)
+if __name__ == "__main__":
+    main()
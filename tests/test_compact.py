@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import SyntheticProvider, ticker_names
+from utils import compact
+from utils.compact import Interner, PriceMatrix
+from utils.price_store import PriceStore
+from utils.quote_cache import QuoteCache
+
+TICKERS = ticker_names(5)
+DATES = pd.bdate_range("2023-01-02", "2024-06-28")
+
+
+@pytest.fixture(scope="module")
+def quotes(tmp_path_factory):
+    """Deterministic quotes of `TICKERS`, without network"""
+    root = str(tmp_path_factory.mktemp("data"))
+    return QuoteCache(PriceStore(root, provider=SyntheticProvider()))
+
+
+def test_interner():
+    names = Interner(["EUR"])
+    codes = names.codes(pd.Series(["USD", "EUR", None, "USD"], dtype="category"))
+    np.testing.assert_array_equal(codes, [1, 0, -1, 1])
+    np.testing.assert_array_equal(names.codes(["GBP", "EUR"]), [2, 0])
+    assert names.decode([2, 1]).tolist() == ["GBP", "USD"]
+    assert len(names) == 3
+
+
+@pytest.mark.parametrize("memmap_bytes", [compact.MEMMAP_BYTES, 0])
+def test_price_matrix(quotes, monkeypatch, memmap_bytes):
+    monkeypatch.setattr(compact, "MEMMAP_BYTES", memmap_bytes)
+    exact = quotes.matrix(TICKERS, DATES, verbose=False)
+    prices = quotes.price_matrix(TICKERS, DATES, verbose=False)
+    np.testing.assert_array_equal(prices.values, exact)
+    assert isinstance(prices.values, np.memmap) == (memmap_bytes == 0)
+
+    compact_prices = quotes.price_matrix(TICKERS, DATES, False, dtype=np.float32)
+    assert compact_prices.nbytes == prices.nbytes - exact.nbytes // 2
+    np.testing.assert_allclose(compact_prices.values, exact, rtol=1e-7)
+
+
+def test_save_and_open(quotes, tmp_path):
+    prices = quotes.price_matrix(TICKERS, DATES, verbose=False, dtype=np.float32)
+    prices.save(str(tmp_path / "prices"))
+    opened = PriceMatrix.open(str(tmp_path / "prices"))
+    assert isinstance(opened.values, np.memmap)
+    pd.testing.assert_frame_equal(opened.frame(), prices.frame(), check_freq=False)
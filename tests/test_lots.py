@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.lots import match_lots
+
+
+def priced_history(rows) -> pd.DataFrame:
+    """Purchase history of (date, ticker, quantity, unit price) rows, priced in EUR"""
+    frame = pd.DataFrame(rows, columns=["Date", "yf_name", "Quantity", "unit_price"])
+    frame["Date"] = pd.to_datetime(frame["Date"])
+    frame["exchange_rate"] = 1.0
+    return frame
+
+
+# Listed out of date order, on purpose
+HISTORY = priced_history(
+    [
+        ("2024-03-01", "AAA", -15.0, 130.0),
+        ("2024-01-02", "AAA", 10.0, 100.0),
+        ("2024-02-01", "AAA", 10.0, 120.0),
+        ("2024-02-01", "BBB", 4.0, 50.0),
+        ("2024-04-02", "BBB", -4.0, 40.0),
+    ]
+)
+
+
+@pytest.mark.parametrize(
+    "method, realized, open_cost",
+    [("fifo", 350.0, 120.0), ("lifo", 250.0, 100.0), ("average", 300.0, 110.0)],
+)
+def test_realized_pnl(method, realized, open_cost):
+    matches, open_lots = match_lots(HISTORY, method)
+    np.testing.assert_allclose(matches["realized"], [realized, 0, 0, 0, -40.0])
+    np.testing.assert_allclose(
+        matches["cost_change"], [realized - 1950.0, 1000.0, 1200.0, 200.0, -200.0]
+    )
+    assert open_lots["yf_name"].tolist() == ["AAA"]
+    np.testing.assert_allclose(open_lots["Quantity"], [5.0])
+    np.testing.assert_allclose(open_lots["unit_cost"], [open_cost])
+
+
+def test_oversell():
+    history = priced_history(
+        [("2024-01-02", "AAA", 3.0, 10.0), ("2024-01-03", "AAA", -4.0, 12.0)]
+    )
+    with pytest.raises(ValueError, match="AAA sold beyond"):
+        match_lots(history)
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError, match="Unknown cost basis method"):
+        match_lots(HISTORY, "hifo")
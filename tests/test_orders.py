@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+from utils.orders import optimize_orders
+
+
+def random_portfolios(n: int = 2000, seed: int = 0):
+    """Random positions, prices, targets and cash influxes"""
+    rng = np.random.default_rng(seed)
+    for _ in range(n):
+        n_assets = rng.integers(2, 6)
+        quantity = rng.integers(0, 15, n_assets).astype(float)
+        price = rng.uniform(5, 120, n_assets).round(2)
+        target = rng.uniform(0, 1, n_assets)
+        cash = float(rng.choice([0, 50, 300]))
+        yield quantity, price, target / target.sum(), cash
+
+
+def test_min_order_keeps_cash_left_positive():
+    # The 27.11 sell paying for the buy is too small to pass
+    shares, cash_left, _ = optimize_orders(
+        [10, 9, 6], [27.11, 88.54, 93.2], [0.15, 0.43, 0.42], [0], min_order=30
+    )
+    assert cash_left[0] >= 0
+    assert np.all((shares[0] == 0) | (np.abs(shares[0]) * [27.11, 88.54, 93.2] >= 30))
+
+
+def test_without_options():
+    shares, cash_left, fees = optimize_orders(
+        [10, 9, 6], [27.11, 88.54, 93.2], [0.15, 0.43, 0.42], [0]
+    )
+    np.testing.assert_array_equal(shares, [[-1, -1, 1]])
+    np.testing.assert_allclose(cash_left, [22.45])
+    np.testing.assert_array_equal(fees, [0])
+
+
+@pytest.mark.parametrize("min_order", [0, 30, 100])
+@pytest.mark.parametrize("fee_fixed, fee_rate", [(0, 0), (1, 0), (0, 0.01), (5, 0.01)])
+def test_fees_and_min_order(min_order, fee_fixed, fee_rate):
+    for quantity, price, target, cash in random_portfolios(500):
+        shares, cash_left, fees = optimize_orders(
+            quantity,
+            price,
+            target,
+            [cash],
+            min_order=min_order,
+            fee_fixed=fee_fixed,
+            fee_rate=fee_rate,
+        )
+        traded = np.abs(shares[0]) * price
+        assert cash_left[0] >= -1e-9
+        assert np.all((shares[0] == 0) | (traded >= min_order))
+        assert np.all(shares[0] >= -quantity)
+        expected_fees = (fee_fixed * (shares[0] != 0) + fee_rate * traded).sum()
+        assert fees[0] == pytest.approx(expected_fees)
+        assert cash_left[0] == pytest.approx(cash - shares[0] @ price - fees[0])
+
+
+def test_no_sell():
+    for quantity, price, target, cash in random_portfolios():
+        shares, cash_left, _ = optimize_orders(
+            quantity, price, target, [cash], fee_fixed=1, allow_sell=False
+        )
+        assert np.all(shares >= 0)
+        assert cash_left[0] >= -1e-9
+
+
+@pytest.mark.parametrize("max_turnover", [0.0, 0.05, 0.2])
+def test_max_turnover(max_turnover):
+    for quantity, price, target, cash in random_portfolios():
+        shares, cash_left, _ = optimize_orders(
+            quantity, price, target, [cash], min_order=30, max_turnover=max_turnover
+        )
+        total = quantity @ price + cash
+        assert np.abs(shares[0] * price).sum() <= max_turnover * total + 1e-9
+        assert cash_left[0] >= -1e-9
+
+
+def test_scenarios_match_one_by_one():
+    quantity, price = [3, 0, 10], [120.0, 15.5, 42.0]
+    targets = np.array([[0.2, 0.3, 0.5], [0.6, 0.4, 0.0]])
+    cash = np.array([0.0, 1000.0])
+    shares, cash_left, fees = optimize_orders(
+        quantity, price, targets, cash, min_order=20, fee_fixed=1, fee_rate=0.005
+    )
+    for i in range(len(cash)):
+        one = optimize_orders(
+            quantity,
+            price,
+            targets[i],
+            cash[i : i + 1],
+            min_order=20,
+            fee_fixed=1,
+            fee_rate=0.005,
+        )
+        np.testing.assert_array_equal(shares[i], one[0][0])
+        assert cash_left[i] == pytest.approx(one[1][0])
+        assert fees[i] == pytest.approx(one[2][0])
@@ -0,0 +1,98 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import SyntheticProvider
+from utils.price_store import COLUMNS, LOOKBACK, PriceStore, _merge
+
+TICKER = "T00000"
+TODAY = pd.Timestamp.today().normalize()
+
+
+class RecordingProvider(SyntheticProvider):
+    """Synthetic quotes, keeping the (ticker, start, end) of every download"""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def history(self, ticker, start, end):
+        self.calls.append((ticker, pd.Timestamp(start), pd.Timestamp(end)))
+        return super().history(ticker, start, end)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PriceStore(str(tmp_path / "data"), provider=RecordingProvider())
+
+
+def assert_stored(store, start):
+    """The store of `TICKER` holds exactly the synthetic quotes since `start`"""
+    expected = SyntheticProvider().history(TICKER, start, TODAY)
+    stored = store.load(TICKER, verbose=False)
+    pd.testing.assert_frame_equal(stored, expected, check_freq=False)
+
+
+def test_ensure_downloads_missing_head_and_tail(store):
+    start = pd.Timestamp("2024-06-03")
+    store.ensure(TICKER, start, verbose=False)
+    assert store.provider.calls == [(TICKER, start - LOOKBACK, TODAY)]
+
+    # Covered already
+    store.ensure(TICKER, start + pd.Timedelta(days=10), verbose=False)
+    assert len(store.provider.calls) == 1
+
+    # Missing head, downloaded up to the first stored quote
+    first = store.read(TICKER)[0][0]
+    earlier = pd.Timestamp("2024-02-01")
+    store.ensure(TICKER, earlier, verbose=False)
+    assert store.provider.calls[-1] == (TICKER, earlier - LOOKBACK, first)
+    assert_stored(store, earlier - LOOKBACK)
+
+    # Missing tail, downloaded again from the last stored quote
+    last = store.read(TICKER)[0][-1]
+    store.ensure(TICKER, earlier, verbose=False, refresh=True)
+    assert store.provider.calls[-1] == (TICKER, pd.Timestamp(last), TODAY)
+    assert_stored(store, earlier - LOOKBACK)
+    assert store._read_meta(TICKER) == {"start": earlier, "fetched": TODAY}
+
+
+def test_merge_keeps_last_duplicate():
+    dates = np.array(["2024-01-02", "2024-01-03", "2024-01-04"], dtype="datetime64[ns]")
+    old = (dates, np.full((len(COLUMNS), 3), 1.0))
+    new = (dates[1:], np.full((len(COLUMNS), 2), 2.0))
+    head = (dates[:1] - np.timedelta64(1, "D"), np.full((len(COLUMNS), 1), 0.0))
+    merged_dates, merged_ohlc = _merge([head, old, new])
+    np.testing.assert_array_equal(merged_dates, np.r_[head[0], dates])
+    np.testing.assert_array_equal(merged_ohlc[3], [0.0, 1.0, 2.0, 2.0])
+
+
+def test_evict_keeps_lookback(store):
+    store.ensure(TICKER, "2024-01-02", verbose=False)
+    before = pd.Timestamp("2024-06-03")
+    store.evict(before=before, verbose=False)
+    dates, _ = store.read(TICKER)
+    assert dates[0] >= np.datetime64(before - LOOKBACK)
+    assert_stored(store, before - LOOKBACK)
+    assert store._read_meta(TICKER)["start"] == before
+
+    store.evict(max_idle_days=0, verbose=False)
+    assert os.path.isdir(os.path.join(store.root, TICKER))
+    store._write(TICKER, *store.read(TICKER), {"start": before, "fetched": before})
+    store.evict(max_idle_days=30, verbose=False)
+    assert not os.path.exists(os.path.join(store.root, TICKER))
+
+
+def test_fold_legacy_csv(store):
+    folder = os.path.join(store.root, TICKER)
+    os.makedirs(folder)
+    legacy = SyntheticProvider().history(TICKER, "2024-01-02", TODAY)
+    for month, quotes in legacy.groupby(legacy["Date"].dt.to_period("M")):
+        quotes.to_csv(os.path.join(folder, f"{month}.csv"), index=False)
+
+    store.compact(verbose=False)
+    assert not any(f.endswith(".csv") for f in os.listdir(folder))
+    assert_stored(store, "2024-01-02")
+    assert store._read_meta(TICKER)["start"] == pd.Timestamp("2024-01-02")
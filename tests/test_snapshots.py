@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.util import hash_pandas_object
+
+from benchmarks.synthetic import SyntheticProvider, ticker_names
+from utils.price_store import PriceStore
+from utils.quote_cache import QuoteCache
+from utils.snapshots import (
+    HASHED_COLUMNS,
+    _last_valid,
+    _load,
+    evaluate_with_snapshots,
+    prefix_hashes,
+)
+from utils.valuation import evaluate_portfolio
+
+TICKERS = ticker_names(4)
+
+
+@pytest.fixture(scope="module")
+def quotes(tmp_path_factory):
+    """Deterministic quotes of `TICKERS`, without network"""
+    root = str(tmp_path_factory.mktemp("data"))
+    return QuoteCache(PriceStore(root, provider=SyntheticProvider()))
+
+
+def history(rows) -> pd.DataFrame:
+    """Purchase history of (date, ticker, currency, quantity) rows"""
+    frame = pd.DataFrame(rows, columns=["Date", "yf_name", "Unit", "Quantity"])
+    frame["Date"] = pd.to_datetime(frame["Date"])
+    return frame.astype({"yf_name": "category", "Unit": "category"})
+
+
+BASE = [
+    ("2024-01-02", TICKERS[0], "EUR", 10.0),
+    ("2024-01-15", TICKERS[1], "USD", 4.0),
+    ("2024-03-04", TICKERS[0], "EUR", -3.0),
+    ("2024-05-06", TICKERS[2], "USD", 7.0),
+    ("2024-08-01", TICKERS[1], "USD", 2.0),
+]
+
+
+def assert_same_valuation(purchase_history, path, quotes):
+    full, _, full_values = evaluate_portfolio(
+        purchase_history.copy(), "EUR", quotes=quotes, verbose=False
+    )
+    resumed, _, values = evaluate_with_snapshots(
+        purchase_history.copy(), "EUR", path, quotes=quotes, verbose=False
+    )
+    pd.testing.assert_frame_equal(resumed, full, check_freq=False)
+    pd.testing.assert_frame_equal(
+        values[full_values.columns], full_values, check_freq=False, check_names=False
+    )
+
+
+def checkpoint(purchase_history, path):
+    """Checkpoint of the snapshot at `path` a run on `purchase_history` resumes from"""
+    sorted_history = purchase_history.sort_values("Date", kind="stable")
+    row_hashes = hash_pandas_object(
+        sorted_history[HASHED_COLUMNS], index=False
+    ).to_numpy()
+    dates = sorted_history["Date"].to_numpy(dtype="datetime64[ns]")
+    return _last_valid(_load(path), dates, row_hashes)
+
+
+def test_prefix_hashes():
+    row_hashes = np.arange(10, dtype=np.uint64)
+    hashes = prefix_hashes(row_hashes, [2, 5, 10])
+    assert hashes == [prefix_hashes(row_hashes, [n])[0] for n in (2, 5, 10)]
+    assert prefix_hashes(row_hashes[:5], [2, 5]) == hashes[:2]
+    assert len(set(hashes)) == 3
+
+
+def test_first_run(quotes, tmp_path):
+    path = str(tmp_path / "snapshot.npz")
+    assert_same_valuation(history(BASE), path, quotes)
+    snapshot = _load(path)
+    assert snapshot is not None
+    assert (np.diff(snapshot["cp_dates"]) > np.timedelta64(0)).all()
+    assert checkpoint(history(BASE), path) is not None
+
+
+def test_resume_after_append(quotes, tmp_path):
+    path = str(tmp_path / "snapshot.npz")
+    evaluate_with_snapshots(history(BASE), "EUR", path, quotes=quotes, verbose=False)
+    appended = history(BASE + [("2024-10-07", TICKERS[3], "EUR", 5.0)])
+
+    # All the checkpoints before the new transaction still hold
+    date, n_rows = checkpoint(appended, path)
+    assert n_rows == len(BASE)
+    assert pd.Timestamp("2024-08-01") <= date < pd.Timestamp("2024-10-07")
+    assert_same_valuation(appended, path, quotes)
+
+
+def test_resume_after_edit(quotes, tmp_path):
+    path = str(tmp_path / "snapshot.npz")
+    evaluate_with_snapshots(history(BASE), "EUR", path, quotes=quotes, verbose=False)
+    edited = BASE.copy()
+    edited[2] = ("2024-03-04", TICKERS[0], "EUR", -5.0)
+
+    # Only the checkpoints before the edited transaction still hold
+    date, n_rows = checkpoint(history(edited), path)
+    assert n_rows == 2
+    assert date < pd.Timestamp("2024-03-04")
+    assert_same_valuation(history(edited), path, quotes)
+
+
+def test_new_ticker_before_checkpoint(quotes, tmp_path):
+    path = str(tmp_path / "snapshot.npz")
+    evaluate_with_snapshots(history(BASE), "EUR", path, quotes=quotes, verbose=False)
+    inserted = history(BASE + [("2024-04-10", TICKERS[3], "USD", 12.0)])
+
+    date, n_rows = checkpoint(inserted, path)
+    assert n_rows == 3
+    assert date < pd.Timestamp("2024-04-10")
+    assert_same_valuation(inserted, path, quotes)
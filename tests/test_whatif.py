@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import SyntheticProvider, ticker_names
+from utils.price_store import PriceStore
+from utils.quote_cache import QuoteCache
+from utils.whatif import what_if
+
+TICKERS = ticker_names(6)
+
+
+@pytest.fixture(scope="module")
+def quotes(tmp_path_factory):
+    """Deterministic quotes of `TICKERS`, without network"""
+    root = str(tmp_path_factory.mktemp("data"))
+    return QuoteCache(PriceStore(root, provider=SyntheticProvider()))
+
+
+def random_portfolio(seed: int):
+    """Few shares of each asset, and two random ideal portfolios of the same assets"""
+    rng = np.random.default_rng(seed)
+    purchase_history = pd.DataFrame(
+        {
+            "Date": pd.Timestamp("2024-01-02"),
+            "yf_name": TICKERS,
+            "Unit": "EUR",
+            "Quantity": rng.integers(1, 12, len(TICKERS)).astype(float),
+        }
+    ).astype({"yf_name": "category", "Unit": "category"})
+    structures = {}
+    for name in ("target_0", "target_1"):
+        weights = rng.uniform(0, 1, len(TICKERS))
+        structures[name] = pd.DataFrame(
+            {
+                "yf_name": TICKERS,
+                "Unit": "EUR",
+                "p_overall": 100 * weights / weights.sum(),
+            }
+        )
+    return purchase_history, structures
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        {},
+        {"min_order": 150},
+        {"min_order": 100, "fee_fixed": 1, "fee_rate": 0.005},
+        {"min_order": 150, "allow_sell": False},
+        {"min_order": 150, "max_turnover": 0.1},
+    ],
+)
+def test_cash_left_positive(quotes, options):
+    for seed in range(30):
+        purchase_history, structures = random_portfolio(seed)
+        scenarios = what_if(
+            purchase_history,
+            structures,
+            [0, 10, 50, 1000],
+            "EUR",
+            quotes=quotes,
+            verbose=False,
+            **options,
+        )
+        cash_left = scenarios.groupby(["target", "cash"])["cash_left"].first()
+        assert len(cash_left) == 8
+        assert (cash_left >= -1e-9).all()
+
+        price = scenarios["order_in_EUR"] / scenarios["order_in_shares"]
+        traded = (scenarios["executable_shares"] * price).abs()
+        passed = scenarios["executable_shares"] != 0
+        assert (traded[passed] >= options.get("min_order", 0) - 1e-9).all()
@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+
+from .fx import fx_matrix
+from .quote_cache import DEFAULT_QUOTES, QuoteCache
+
+# Number of dates scanned at once when looking for the next drift-threshold breach
+_SCAN_BLOCK = 256
+
+
+def ideal_weights(portfolio_structure: pd.DataFrame) -> pd.Series:
+    """Target weight (summing to 1) of each `yf_name` of a formatted ideal portfolio"""
+    weights = portfolio_structure.groupby("yf_name")["p_overall"].sum()
+    return weights / weights.sum()
+
+
+def price_history(
+    portfolio_structure: pd.DataFrame,
+    ref_currency: str,
+    start: pd.Timestamp,
+    quotes: QuoteCache = DEFAULT_QUOTES,
+    verbose: bool = True,
+    dtype=np.float64,
+) -> pd.DataFrame:
+    """Daily (business days) prices in `ref_currency` of each asset of the portfolio,
+    as `dtype` (float32 halves the memory)"""
+    dates = pd.bdate_range(start, pd.Timestamp.today().normalize())
+    assets = portfolio_structure.drop_duplicates("yf_name")
+    tickers = assets["yf_name"].tolist()
+    currencies, fx_columns = np.unique(
+        assets["Unit"].to_numpy(dtype=str), return_inverse=True
+    )
+
+    prices = quotes.price_matrix(tickers, dates, verbose=verbose, dtype=dtype)
+    fx = fx_matrix(currencies.tolist(), ref_currency, dates, quotes, verbose=verbose)
+    # Converted in place, one contiguous column at a time
+    for i, fx_column in enumerate(fx_columns):
+        prices.values[:, i] *= fx[:, fx_column]
+    return prices.frame()
+
+
+def _calendar_rebalances(dates: pd.DatetimeIndex, freq: str) -> np.ndarray:
+    """Index of the first date of each period of frequency `freq`"""
+    periods = dates.to_period(freq).asi8
+    return np.flatnonzero(np.r_[True, periods[1:] != periods[:-1]])
+
+
+def _threshold_rebalances(
+    prices: np.ndarray, weights: np.ndarray, threshold: float
+) -> np.ndarray:
+    """Index of the dates where a weight drifts more than `threshold` away from its
+    target since the previous rebalance"""
+    rebalances = [0]
+    start = 0
+    while True:
+        # Scan the following dates by blocks until the first breach
+        breach = None
+        for block_start in range(start + 1, len(prices), _SCAN_BLOCK):
+            block = prices[block_start : block_start + _SCAN_BLOCK] / prices[start]
+            drifted = block * weights
+            drifted /= drifted.sum(axis=1, keepdims=True)
+            breached = np.abs(drifted - weights).max(axis=1) > threshold
+            if breached.any():
+                breach = block_start + int(breached.argmax())
+                break
+        if breach is None:
+            return np.array(rebalances)
+        rebalances.append(breach)
+        start = breach
+
+
+def backtest(
+    prices: pd.DataFrame,
+    weights: pd.Series,
+    freq: str = "M",
+    threshold: float = None,
+    cost: float = 0.0,
+    initial_value: float = 100.0,
+) -> tuple[pd.Series, pd.Series, pd.DataFrame]:
+    """Simulate a portfolio rebalanced to `weights` over the `prices` (dates x assets).
+
+    The portfolio is rebalanced at the start of each period of frequency `freq`
+    ("W", "M", "Q", "Y"), or, if `threshold` is given (`freq` being then ignored), as
+    soon as a weight drifts by more than `threshold` from its target. `cost` is the
+    fraction of the traded value paid at each rebalance.
+
+    Between two rebalances the holdings are constant, so the whole value path is
+    computed from the price relatives to the last rebalance with array operations.
+    Returns the value of the portfolio, the turnover (traded value over portfolio
+    value) at each rebalance and the value traded per asset at each rebalance.
+    """
+    w = weights.reindex(prices.columns).fillna(0).to_numpy()
+    w = w / w.sum()
+    # Assets without quotes yet are kept at their first known price
+    p = prices.replace(0, np.nan).bfill().ffill().fillna(1).to_numpy()
+
+    if threshold is None:
+        rebalances = _calendar_rebalances(prices.index, freq)
+    else:
+        rebalances = _threshold_rebalances(p, w, threshold)
+
+    # Growth of each segment between two rebalances, and weights reached at its end
+    drifted = p[rebalances[1:]] / p[rebalances[:-1]] * w
+    segment_growth = drifted.sum(axis=1)
+    drifted /= segment_growth[:, None]
+    turnover = np.r_[1.0, np.abs(w - drifted).sum(axis=1)]
+
+    # Value at each rebalance (after paying the costs) and along each segment
+    start_value = initial_value * np.cumprod(
+        np.r_[1.0 - cost, segment_growth * (1 - cost * turnover[1:])]
+    )
+    segment = np.searchsorted(rebalances, np.arange(len(p)), side="right") - 1
+    value = start_value[segment] * ((p / p[rebalances][segment]) @ w)
+
+    # Traded value per asset: target positions minus the drifted ones
+    value_before = np.r_[initial_value, start_value[:-1] * segment_growth]
+    before = np.vstack([np.zeros(len(w)), drifted]) * value_before[:, None]
+    trades = w * start_value[:, None] - before
+
+    dates = prices.index[rebalances]
+    return (
+        pd.Series(value, index=prices.index, name="value"),
+        pd.Series(turnover, index=dates, name="turnover"),
+        pd.DataFrame(trades, index=dates, columns=prices.columns),
+    )
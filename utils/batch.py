@@ -0,0 +1,153 @@
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from rich import print
+
+from .current_asset_value import (
+    access_current_asset_value,
+    provide_breakdown_existing_assets,
+)
+from .format_ideal_portfolio import read_portfolio
+from .orders import get_list_of_orders
+from .planner import build_price_context, plan_fetches
+from .price_store import DEFAULT_STORE, PriceStore
+from .providers import QuoteProvider
+from .quote_cache import DEFAULT_QUOTES
+
+
+def find_portfolios(patterns: list[str]) -> list[str]:
+    """Folders matching any of the `patterns` (paths or globs) holding both an
+    `_ideal_portfolio.csv` and a `_history.csv`"""
+    folders = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            if all(
+                os.path.exists(os.path.join(path, name))
+                for name in ("_ideal_portfolio.csv", "_history.csv")
+            ):
+                folders.append(os.path.normpath(path))
+    return list(dict.fromkeys(folders))
+
+
+def _init_worker(root: str, provider: QuoteProvider):
+    # Every worker memory-maps the same store, already up to date: no download. The
+    # provider is passed too, as spawned workers do not inherit e.g. `--fixtures`
+    DEFAULT_STORE.root = root
+    DEFAULT_STORE.provider = provider
+
+
+def process_portfolio(
+    path_portfolio: str,
+    ref_currency: str,
+    investment: float = 0.0,
+    order_options: dict = None,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Breakdown and orders of one portfolio, read from the shared price store"""
+    portfolio_structure, holdings = read_portfolio(path_portfolio, holdings=True)
+    quotes = build_price_context(
+        portfolio_structure,
+        holdings,
+        ref_currency,
+        history=False,
+        verbose=False,
+    )
+    access_current_asset_value(
+        portfolio_structure, ref_currency, verbose=False, quotes=quotes
+    )
+    assets_breakdown = provide_breakdown_existing_assets(
+        holdings, investment, ref_currency, verbose=False, quotes=quotes
+    )
+    orders = get_list_of_orders(
+        assets_breakdown,
+        portfolio_structure,
+        ref_currency,
+        verbose=False,
+        **(order_options or {}),
+    )
+    return assets_breakdown, orders
+
+
+def _process(task: tuple) -> tuple:
+    path_portfolio, args = task
+    try:
+        return path_portfolio, process_portfolio(path_portfolio, *args), None
+    except Exception as e:
+        return path_portfolio, None, f"{type(e).__name__}: {e}"
+
+
+def run_batch(
+    folders: list[str],
+    ref_currency: str,
+    output: str,
+    investment: float = 0.0,
+    order_options: dict = None,
+    store: PriceStore = DEFAULT_STORE,
+    max_workers: int = None,
+    verbose: bool = True,
+) -> dict:
+    """Breakdown and orders of many portfolios, written to `<output>_breakdown.csv`
+    and `<output>_orders.csv` with a `portfolio` column.
+
+    The union of the tickers of all the portfolios is downloaded once into the
+    `store`, then the portfolios are processed in parallel by a pool of processes,
+    all memory-mapping the same (read-only) price files. Returns the error of each
+    portfolio that failed.
+    """
+    starts, errors, valid = {}, {}, []
+    for path_portfolio in folders:
+        try:
+            portfolio_structure, holdings = read_portfolio(
+                path_portfolio, holdings=True
+            )
+            needed = plan_fetches(
+                portfolio_structure, holdings, ref_currency, history=False
+            )
+        except Exception as e:
+            errors[path_portfolio] = f"{type(e).__name__}: {e}"
+            continue
+        valid.append(path_portfolio)
+        for ticker, start in needed.items():
+            starts[ticker] = min(start, starts.get(ticker, start))
+    if verbose:
+        print(f"{len(valid)} portfolios, {len(starts)} distinct tickers")
+    DEFAULT_QUOTES.maxsize = max(DEFAULT_QUOTES.maxsize, len(starts))
+    fetch_errors = store.ensure_many(starts, verbose=verbose)
+
+    tasks = [
+        (path_portfolio, (ref_currency, investment, order_options))
+        for path_portfolio in valid
+    ]
+    breakdowns, orders = [], []
+    max_workers = max_workers or os.cpu_count() or 1
+    chunksize = max(1, len(tasks) // (4 * max_workers))
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=_init_worker,
+        initargs=(store.root, store.provider),
+    ) as pool:
+        for path_portfolio, result, error in pool.map(
+            _process, tasks, chunksize=chunksize
+        ):
+            if error is not None:
+                errors[path_portfolio] = error
+                continue
+            for frames, frame in zip((breakdowns, orders), result):
+                frames.append(frame.assign(portfolio=path_portfolio))
+
+    for name, frames in (("breakdown", breakdowns), ("orders", orders)):
+        if frames:
+            consolidated = pd.concat(frames, ignore_index=True)
+            columns = ["portfolio", *consolidated.columns.drop("portfolio")]
+            consolidated[columns].to_csv(f"{output}_{name}.csv", index=False)
+
+    if verbose:
+        print(f"{len(folders) - len(errors)} portfolios written to {output}_*.csv")
+        for ticker, e in fetch_errors.items():
+            print(
+                f"[bold yellow]Warning:[/bold yellow] failed to retrieve {ticker}: {e}"
+            )
+        for path_portfolio, error in errors.items():
+            print(f"[bold red]Failed:[/bold red] {path_portfolio}: {error}")
+    return errors
@@ -0,0 +1,172 @@
+"""Compact representation of large universes and long histories.
+
+Memory budget per million price points (one ticker at one date):
+- `PriceMatrix` of closes: 4 MB in float32 (relative error below 1e-7), 8 MB in
+  float64, plus 8 bytes per date shared by all the tickers. Above `MEMMAP_BYTES` it
+  is memory-mapped, only the pages in use are resident.
+- `PriceStore` on disk: 40 MB (4 float64 OHLC columns and a datetime64 date).
+- `QuoteCache`: 16 MB (int64 date and float64 close) for the windows it holds.
+- Valuation of a history: 24 MB at most in float64, 16 MB in float32 (holdings,
+  prices and the aligned exchange rates), the values being computed in place of
+  the prices.
+So 10k tickers over 20 years of daily quotes (50M points) take 200 MB as a float32
+`PriceMatrix`. Tickers and currencies are interned as int32 codes: 4 bytes per row
+instead of a pointer to a Python string.
+"""
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# Matrices larger than this are memory-mapped to a temporary file
+MEMMAP_BYTES = 1 << 30
+
+
+class Interner:
+    """Table of distinct names (tickers, currencies), each given an int32 code once"""
+
+    __slots__ = ("names", "_codes")
+
+    def __init__(self, names=()):
+        self.names = []
+        self._codes = {}
+        self.codes(names)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def code(self, name: str) -> int:
+        code = self._codes.get(name)
+        if code is None:
+            code = self._codes[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+    def codes(self, names) -> np.ndarray:
+        """Code of each of `names` (-1 if missing), each distinct name being looked up
+        once: a categorical column is interned from its categories only"""
+        if not isinstance(names, pd.Series):
+            names = pd.Series(np.asarray(names, dtype=object))
+        inverse, uniques = pd.factorize(names)
+        # The extra last code is the one of the missing names (inverse -1)
+        table = np.array([self.code(name) for name in uniques] + [-1], dtype=np.int32)
+        return table[inverse]
+
+    def decode(self, codes) -> np.ndarray:
+        return np.asarray(self.names, dtype=object)[np.asarray(codes)]
+
+
+# Codes shared by every stage of the process
+TICKERS = Interner()
+CURRENCIES = Interner()
+
+
+class Position:
+    """Quantity held of an asset, with its latest quote and exchange rate"""
+
+    __slots__ = ("ticker", "currency", "quantity", "unit_price", "exchange_rate")
+
+    def __init__(self, ticker, currency, quantity, unit_price, exchange_rate):
+        self.ticker = ticker
+        self.currency = currency
+        self.quantity = quantity
+        self.unit_price = unit_price
+        self.exchange_rate = exchange_rate
+
+    @property
+    def value(self) -> float:
+        """Value in the reference currency"""
+        return self.quantity * self.unit_price * self.exchange_rate
+
+
+class Order:
+    """Number of shares to trade of an asset, and their value"""
+
+    __slots__ = ("ticker", "shares", "amount")
+
+    def __init__(self, ticker, shares, amount):
+        self.ticker = ticker
+        self.shares = shares
+        self.amount = amount
+
+
+def positions(assets_breakdown: pd.DataFrame) -> list[Position]:
+    """Records of the rows of `provide_breakdown_existing_assets`, with interned
+    ticker and currency codes"""
+    return list(
+        map(
+            Position,
+            TICKERS.codes(assets_breakdown["yf_name"]).tolist(),
+            CURRENCIES.codes(assets_breakdown["Unit"]).tolist(),
+            assets_breakdown["Quantity"].tolist(),
+            assets_breakdown["unit_price"].tolist(),
+            assets_breakdown["exchange_rate"].tolist(),
+        )
+    )
+
+
+def orders(order: pd.DataFrame, currency: str) -> list[Order]:
+    """Records of the rows of `get_list_of_orders`, with interned ticker codes"""
+    return list(
+        map(
+            Order,
+            TICKERS.codes(order["yf_name"]).tolist(),
+            order["executable_shares"].tolist(),
+            order[f"order_in_{currency}"].tolist(),
+        )
+    )
+
+
+class PriceMatrix:
+    """Prices of many tickers (columns) at aligned dates (rows), in one contiguous
+    column-major array, in memory or memory-mapped"""
+
+    __slots__ = ("dates", "tickers", "values")
+
+    def __init__(self, dates, tickers: list[str], values: np.ndarray):
+        self.dates = pd.DatetimeIndex(dates)
+        self.tickers = list(tickers)
+        self.values = values
+
+    @classmethod
+    def empty(cls, dates, tickers: list[str], dtype=np.float64) -> "PriceMatrix":
+        """Uninitialized matrix, memory-mapped to an anonymous temporary file if larger
+        than `MEMMAP_BYTES`"""
+        shape = (len(dates), len(tickers))
+        if np.dtype(dtype).itemsize * shape[0] * shape[1] <= MEMMAP_BYTES:
+            return cls(dates, tickers, np.empty(shape, dtype=dtype, order="F"))
+        # The file is deleted once closed, the map keeps it alive until released
+        with tempfile.TemporaryFile() as f:
+            values = np.memmap(f, dtype=dtype, mode="w+", shape=shape, order="F")
+        return cls(dates, tickers, values)
+
+    def save(self, path: str) -> None:
+        """Write the matrix to the folder `path`, to be memory-mapped by `open`"""
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "dates.npy"), self.dates.to_numpy("datetime64[ns]"))
+        with open(os.path.join(path, "tickers.json"), "w") as f:
+            json.dump(self.tickers, f)
+        np.save(os.path.join(path, "values.npy"), self.values)
+
+    @classmethod
+    def open(cls, path: str) -> "PriceMatrix":
+        """Memory-map a matrix written by `save`"""
+        with open(os.path.join(path, "tickers.json")) as f:
+            tickers = json.load(f)
+        return cls(
+            np.load(os.path.join(path, "dates.npy")),
+            tickers,
+            np.load(os.path.join(path, "values.npy"), mmap_mode="r"),
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return self.values.nbytes + self.dates.nbytes
+
+    def frame(self) -> pd.DataFrame:
+        """The matrix as a DataFrame, without copy"""
+        return pd.DataFrame(
+            self.values, index=self.dates, columns=self.tickers, copy=False
+        )
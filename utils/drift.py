@@ -0,0 +1,254 @@
+import heapq
+
+import numpy as np
+import pandas as pd
+
+from .compact import CURRENCIES
+from .profiler import PROFILER
+from .quote_cache import DEFAULT_QUOTES, QuoteCache
+
+
+class DriftMonitor:
+    """Real and desired weights (in %) of a portfolio, updated quote by quote.
+
+    The value of each position and the total of the portfolio are kept up to date in
+    O(1) per changed quote. The assets are kept in a heap by their drift beyond their
+    band, |p_desired - p_real| - band, so that the breaches are found without
+    evaluating every asset. The band of an asset is `band` percentage points, or
+    `relative_band` times its desired weight if smaller.
+
+    A change of the total moves the weights of every asset, so the keys of the heap
+    are lazy: each is exact at the total it was computed with, and the heap is
+    rebuilt once the total moved by more than `tolerance` (relative) since the last
+    rebuild, which bounds the error of any key. Outdated entries are skipped when
+    popped, and dropped at the next rebuild.
+    """
+
+    def __init__(
+        self,
+        tickers: list[str],
+        quantities,
+        prices,
+        rates,
+        currencies: list[str],
+        targets,
+        cash: float = 0.0,
+        band: float = 5.0,
+        relative_band: float = None,
+        tolerance: float = 0.005,
+    ):
+        self.tickers = list(tickers)
+        self.index = {ticker: i for i, ticker in enumerate(self.tickers)}
+        self.quantities = np.asarray(quantities, dtype=float)
+        self.prices = np.asarray(prices, dtype=float)
+        self.rates = np.asarray(rates, dtype=float)
+        self.currencies = CURRENCIES.codes(currencies)
+        self.targets = np.asarray(targets, dtype=float)
+        self.bands = np.full(len(self.tickers), float(band))
+        if relative_band is not None:
+            self.bands = np.minimum(self.bands, relative_band * self.targets)
+        self.cash = cash
+        self.tolerance = tolerance
+        self.breached = set()
+        self._version = np.zeros(len(self.tickers), dtype=np.int64)
+        self._rebuild()
+
+    @classmethod
+    def from_breakdown(
+        cls,
+        assets_breakdown: pd.DataFrame,
+        portfolio_structure: pd.DataFrame,
+        **kwargs,
+    ) -> "DriftMonitor":
+        """Monitor of the existing positions of `provide_breakdown_existing_assets`
+        against the ideal portfolio, whose assets not held yet are priced with
+        `access_current_asset_value`"""
+        is_cash = assets_breakdown["yf_name"] == "CASH"
+        held = assets_breakdown[~is_cash]
+        cash = assets_breakdown.loc[is_cash, "Quantity"].sum()
+        structure = portfolio_structure.dropna(subset=["yf_name"])
+        ideal = structure.groupby("yf_name").agg(
+            p_desired=("p_overall", "sum"),
+            Unit=("Unit", "first"),
+            **{
+                column: (column, "first")
+                for column in ("unit_price", "exchange_rate")
+                if column in structure
+            },
+        )
+        assets = held.set_index("yf_name")[
+            ["Unit", "Quantity", "unit_price", "exchange_rate"]
+        ].combine_first(ideal.drop(columns="p_desired"))
+        assets = assets.join(ideal["p_desired"]).fillna(
+            {"Quantity": 0.0, "unit_price": 0.0, "exchange_rate": 0.0, "p_desired": 0.0}
+        )
+        return cls(
+            assets.index.tolist(),
+            assets["Quantity"],
+            assets["unit_price"],
+            assets["exchange_rate"],
+            assets["Unit"],
+            assets["p_desired"],
+            cash=cash,
+            **kwargs,
+        )
+
+    def _excess(self, i: int) -> float:
+        p_real = 100 * self.values[i] / self.total if self.total else 0.0
+        return abs(self.targets[i] - p_real) - self.bands[i]
+
+    def _push(self, i: int) -> None:
+        self._version[i] += 1
+        heapq.heappush(self._heap, (-self._excess(i), int(self._version[i]), i))
+
+    def _rebuild(self) -> None:
+        """Recompute the total and every key from scratch"""
+        self.values = self.quantities * self.prices * self.rates
+        self.total = self.values.sum() + self.cash
+        self._total_at_rebuild = self.total
+        self._version += 1
+        with np.errstate(divide="ignore", invalid="ignore"):
+            p_real = np.nan_to_num(100 * self.values / self.total)
+        excess = np.abs(self.targets - p_real) - self.bands
+        self._heap = list(zip(-excess, self._version.tolist(), range(len(excess))))
+        heapq.heapify(self._heap)
+        PROFILER.count("drift_rebuilds")
+
+    def _error_bound(self) -> float:
+        """Largest error (in percentage points) of a key of the heap: every key was
+        computed at a total within `tolerance` of the one at the last rebuild, as is
+        the current total"""
+        return 100 * 2 * self.tolerance / (1 - self.tolerance)
+
+    def _moved(self, i: int, value: float) -> None:
+        self.total += value - self.values[i]
+        self.values[i] = value
+        drifted = abs(self.total / self._total_at_rebuild - 1) > self.tolerance
+        if drifted or len(self._heap) > 4 * len(self.tickers) + 16:
+            self._rebuild()
+        else:
+            self._push(i)
+
+    def update(self, ticker: str, price: float) -> None:
+        """New quote of `ticker`, in its currency"""
+        i = self.index.get(ticker)
+        if i is None:
+            return
+        self.prices[i] = price
+        self._moved(i, self.quantities[i] * price * self.rates[i])
+
+    def update_fx(self, currency: str, rate: float) -> None:
+        """New exchange rate of `currency` to the reference currency"""
+        for i in np.flatnonzero(self.currencies == CURRENCIES.code(currency)):
+            self.rates[i] = rate
+            self._moved(i, self.quantities[i] * self.prices[i] * rate)
+
+    def set_cash(self, cash: float) -> None:
+        """New amount of cash to invest, counted in the total"""
+        self.total += cash - self.cash
+        self.cash = cash
+        if abs(self.total / self._total_at_rebuild - 1) > self.tolerance:
+            self._rebuild()
+
+    def check(self) -> list[str]:
+        """Assets newly out of their band since the last check, the largest drift
+        first. Only the assets whose key may be a breach are evaluated exactly."""
+        bound = self._error_bound()
+        popped, breached = [], set()
+        while self._heap and -self._heap[0][0] > -bound:
+            key, version, i = heapq.heappop(self._heap)
+            if version != self._version[i]:
+                continue
+            popped.append(i)
+            if self._excess(i) > 0:
+                breached.add(i)
+        for i in popped:
+            self._push(i)
+
+        new = breached - self.breached
+        self.breached = breached
+        return [self.tickers[i] for i in sorted(new, key=self._excess, reverse=True)]
+
+    def weights(self) -> pd.DataFrame:
+        """Desired and real weight, and drift of each asset, the largest drift first"""
+        p_real = 100 * self.values / self.total if self.total else 0 * self.values
+        weights = pd.DataFrame(
+            {
+                "yf_name": self.tickers,
+                "p_desired": self.targets,
+                "p_real": p_real,
+                "drift": p_real - self.targets,
+                "band": self.bands,
+            }
+        )
+        return weights.sort_values("drift", key=abs, ascending=False, ignore_index=True)
+
+
+def recorded_feed(
+    tickers: list[str],
+    start: pd.Timestamp,
+    quotes: QuoteCache = DEFAULT_QUOTES,
+    verbose: bool = True,
+) -> pd.DataFrame:
+    """Daily closes (Date, yf_name, Close) of `tickers` since `start`, in date order,
+    to replay into monitors offline"""
+    tickers = [ticker for ticker in tickers if ticker != "--"]
+    quotes.prefetch({ticker: start for ticker in tickers}, verbose=verbose)
+    frames = []
+    for ticker in tickers:
+        dates, close = quotes.series(ticker, start, verbose=verbose)
+        kept = dates >= pd.Timestamp(start).value
+        frames.append(
+            pd.DataFrame(
+                {
+                    "Date": pd.to_datetime(dates[kept]),
+                    "yf_name": ticker,
+                    "Close": close[kept],
+                }
+            )
+        )
+    if not frames:
+        return pd.DataFrame(columns=["Date", "yf_name", "Close"])
+    return pd.concat(frames).sort_values("Date", kind="stable", ignore_index=True)
+
+
+def replay(monitors: dict[str, DriftMonitor], feed: pd.DataFrame) -> pd.DataFrame:
+    """Feed the quotes (Date, yf_name, Close) to each monitor holding the ticker, and
+    check the monitors updated at the end of each date.
+
+    Returns the rebalance signals: each asset of a portfolio leaving its band.
+    """
+    holders = {}
+    for name, monitor in monitors.items():
+        for ticker in monitor.tickers:
+            holders.setdefault(ticker, []).append(name)
+
+    signals = []
+
+    def check(date, names):
+        for name in names:
+            monitor = monitors[name]
+            for ticker in monitor.check():
+                i = monitor.index[ticker]
+                p_real = 100 * monitor.values[i] / monitor.total
+                signals.append(
+                    (date, name, ticker, monitor.targets[i], p_real, monitor.bands[i])
+                )
+
+    current, updated = None, set()
+    for date, ticker, price in feed[["Date", "yf_name", "Close"]].itertuples(
+        index=False
+    ):
+        if date != current:
+            check(current, updated)
+            current, updated = date, set()
+        for name in holders.get(ticker, ()):
+            monitors[name].update(ticker, price)
+            updated.add(name)
+    check(current, updated)
+
+    signals = pd.DataFrame(
+        signals, columns=["Date", "portfolio", "yf_name", "p_desired", "p_real", "band"]
+    )
+    signals["drift"] = signals["p_real"] - signals["p_desired"]
+    return signals
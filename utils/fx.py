@@ -0,0 +1,159 @@
+import numpy as np
+import pandas as pd
+
+from .compact import CURRENCIES
+from .quote_cache import DEFAULT_QUOTES, QuoteCache, to_ns
+
+# Currency graph: each currency is quoted against a single other currency (its
+# parent), and the rate between any two currencies is derived by going up to their
+# common ancestor. Every currency is quoted against USD, the root, unless listed in
+# `QUOTED_AGAINST` (e.g. "CHF": "EUR" to go through EURCHF=x), so only one base
+# pair is downloaded per currency whatever the reference currencies are.
+ROOT_CURRENCY = "USD"
+QUOTED_AGAINST = {"EUR": "USD"}
+
+
+def _pair(x: str, y: str) -> str:
+    """Yahoo Finance name of the rate from x to y (price of one x in y)"""
+    return f"{x}{y}=x"
+
+
+def _path_to_root(x: str) -> list[str]:
+    path = [x]
+    while path[-1] != ROOT_CURRENCY:
+        path.append(QUOTED_AGAINST.get(path[-1], ROOT_CURRENCY))
+        if path[-1] in path[:-1]:
+            raise ValueError(f"The currency graph has a cycle: {path}")
+    return path
+
+
+def fx_legs(x: str, ref_currency: str) -> list[tuple[str, int]]:
+    """Base pairs to multiply (+1) or divide by (-1) to convert x to `ref_currency`"""
+    if x == ref_currency:
+        return []
+
+    path_x, path_ref = _path_to_root(x), _path_to_root(ref_currency)
+    # Stop at the first common ancestor of both currencies
+    while len(path_x) > 1 and len(path_ref) > 1 and path_x[-2] == path_ref[-2]:
+        path_x.pop()
+        path_ref.pop()
+
+    legs = [(_pair(a, b), 1) for a, b in zip(path_x[:-1], path_x[1:])]
+    legs += [(_pair(a, b), -1) for a, b in zip(path_ref[:-1], path_ref[1:])][::-1]
+    return legs
+
+
+def fx_tickers(currencies, ref_currency: str) -> list[str]:
+    """Base pairs needed to convert all of `currencies` to `ref_currency`"""
+    tickers = [
+        ticker
+        for x in pd.unique(pd.Series(currencies, dtype=object).dropna())
+        for ticker, _ in fx_legs(x, ref_currency)
+    ]
+    return list(dict.fromkeys(tickers))
+
+
+def fx_rates(
+    currencies,
+    ref_currency: str,
+    dates=None,
+    quotes: QuoteCache = DEFAULT_QUOTES,
+    verbose: bool = True,
+) -> np.ndarray:
+    """Exchange rate of each of `currencies` to `ref_currency`, at the matching date of
+    `dates` (today if None).
+
+    Each base pair is looked up once for all the rows that need it.
+    """
+    # Interned currency codes: rows are matched on int32 codes, not on strings
+    codes = CURRENCIES.codes(currencies)
+    when = pd.to_datetime(to_ns([None] * len(codes) if dates is None else dates))
+
+    rates = np.ones(len(codes))
+    rows_per_leg = {}
+    for code in pd.unique(codes[codes >= 0]):
+        for ticker, exponent in fx_legs(CURRENCIES.names[code], ref_currency):
+            rows_per_leg.setdefault((ticker, exponent), []).append(code)
+    for (ticker, exponent), leg_codes in rows_per_leg.items():
+        rows = np.isin(codes, leg_codes)
+        leg_quotes = quotes.quotes([ticker] * rows.sum(), when[rows], verbose=verbose)
+        rates[rows] *= leg_quotes**exponent
+    return rates
+
+
+def fx_matrix(
+    currencies: list[str],
+    ref_currency: str,
+    dates: pd.DatetimeIndex,
+    quotes: QuoteCache = DEFAULT_QUOTES,
+    verbose: bool = True,
+) -> np.ndarray:
+    """Last exchange rate known at each of `dates` (rows) of each of `currencies`
+    (columns) to `ref_currency`, every base pair being aligned on `dates` once"""
+    tickers = fx_tickers(currencies, ref_currency)
+    base = quotes.matrix(tickers, dates, verbose=verbose)
+    column = {ticker: i for i, ticker in enumerate(tickers)}
+
+    rates = np.ones((len(dates), len(currencies)))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for i, x in enumerate(currencies):
+            for ticker, exponent in fx_legs(x, ref_currency):
+                rates[:, i] *= base[:, column[ticker]] ** exponent
+    # No quote known yet for some leg
+    rates[~np.isfinite(rates)] = 0
+    return rates
+
+
+def fx_vectors(
+    currencies,
+    ref_currencies: list[str],
+    dates=None,
+    quotes: QuoteCache = DEFAULT_QUOTES,
+    verbose: bool = True,
+) -> np.ndarray:
+    """Exchange rate of each of `currencies` (rows) to each of `ref_currencies`
+    (columns), at the matching date of `dates` (today if None).
+
+    The rates to the root currency are looked up once, then divided by the rate of
+    each reference currency to the root.
+    """
+    to_root = fx_rates(currencies, ROOT_CURRENCY, dates, quotes=quotes, verbose=verbose)
+    refs_to_root = np.column_stack(
+        [
+            fx_rates([ref] * len(to_root), ROOT_CURRENCY, dates, quotes, verbose)
+            for ref in ref_currencies
+        ]
+    )
+    return to_root[:, None] / refs_to_root
+
+
+def fx_matrices(
+    currencies: list[str],
+    ref_currencies: list[str],
+    dates: pd.DatetimeIndex,
+    quotes: QuoteCache = DEFAULT_QUOTES,
+    verbose: bool = True,
+) -> np.ndarray:
+    """`fx_matrix` to each of `ref_currencies` (first axis), from the rates of
+    `currencies` and `ref_currencies` to the root currency aligned on `dates` once"""
+    to_root = fx_matrix(currencies, ROOT_CURRENCY, dates, quotes, verbose=verbose)
+    refs_to_root = fx_matrix(ref_currencies, ROOT_CURRENCY, dates, quotes, verbose)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rates = to_root[None, :, :] / refs_to_root.T[:, :, None]
+    # No quote known yet for some leg
+    rates[~np.isfinite(rates)] = 0
+    return rates
+
+
+def convert(
+    values,
+    currencies,
+    ref_currency: str,
+    dates=None,
+    quotes: QuoteCache = DEFAULT_QUOTES,
+    verbose: bool = True,
+) -> np.ndarray:
+    """Convert a whole column of `values`, each in its currency, to `ref_currency`"""
+    return np.asarray(values, dtype=float) * fx_rates(
+        currencies, ref_currency, dates, quotes=quotes, verbose=verbose
+    )
@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+
+
+def portfolio_levels(portfolio_csv: pd.DataFrame) -> list[str]:
+    """Names of the level columns (L1, L2, ...) of an ideal portfolio"""
+    levels = [c for c in portfolio_csv.columns if c.startswith("L") and c[1:].isdigit()]
+    return sorted(levels, key=lambda c: int(c[1:]))
+
+
+class Hierarchy:
+    """Tree of the ideal portfolio stored as flat arrays.
+
+    Node 0 is the root, and the nodes of a level come after the ones of the previous
+    level, so a parent always has a smaller index than its children:
+    - `names`, `weights` (in % of the parent) and `depth` of each node,
+    - `parent`: index of the parent of each node (-1 for the root),
+    - `row_node`: deepest node of each row of the portfolio,
+    - `conflicts`: nodes given different weights on different rows.
+    """
+
+    def __init__(self, portfolio_csv: pd.DataFrame, levels: list[str] = None):
+        levels = portfolio_levels(portfolio_csv) if levels is None else levels
+        names, weights, parent, depth = ["Portfolio"], [100.0], [-1], [0]
+        conflicts = []
+        self.level_node = {}
+
+        n_rows = len(portfolio_csv)
+        row_node = np.zeros(n_rows, dtype=np.int64)
+        path = pd.Series("", index=portfolio_csv.index)
+        for k, level in enumerate(levels, start=1):
+            values = portfolio_csv[level]
+            present = values.notna().to_numpy()
+            path = path + "\x1f" + values.astype(str)
+            codes, _ = pd.factorize(path.where(present))
+            rows = np.flatnonzero(present)
+            _, first = np.unique(codes[rows], return_index=True)
+            first_rows = rows[first]
+
+            # The weight of a node is the first one given on its rows
+            p = pd.Series(portfolio_csv[f"p_{level}"].to_numpy()[rows])
+            by_node = p.groupby(codes[rows])
+            offset = len(names)
+            names += values.to_numpy()[first_rows].astype(str).tolist()
+            weights += by_node.first().to_numpy(dtype=float).tolist()
+            parent += row_node[first_rows].tolist()
+            depth += [k] * len(first_rows)
+            conflicts += (offset + np.flatnonzero(by_node.nunique() > 1)).tolist()
+
+            self.level_node[level] = np.where(present, offset + codes, -1)
+            row_node[rows] = offset + codes[rows]
+
+        self.levels = levels
+        self.names = names
+        self.weights = np.array(weights)
+        self.parent = np.array(parent)
+        self.depth = np.array(depth)
+        self.row_node = row_node
+        self.conflicts = conflicts
+
+    def shares(self) -> np.ndarray:
+        """Share (in [0, 1]) of the whole portfolio of each node: product of the
+        weights on its path, a missing weight counting as 100%"""
+        factor = np.nan_to_num(self.weights, nan=100.0) / 100
+        share = np.ones(len(self.names))
+        for k in range(1, self.depth.max(initial=0) + 1):
+            nodes = np.flatnonzero(self.depth == k)
+            share[nodes] = share[self.parent[nodes]] * factor[nodes]
+        return share
+
+    def p_overall(self) -> np.ndarray:
+        """Weight (in %) of each row, identical leaves sharing their node equally"""
+        n_rows = np.bincount(self.row_node, minlength=len(self.names))
+        p = self.shares()[self.row_node] / n_rows[self.row_node]
+        return p / p.sum() * 100
+
+    def validate(self, tolerance: float = 1e-6) -> list[str]:
+        """Describe the human errors found when filling the portfolio"""
+        warnings = [
+            f"Different weights are given to the same category: {self.names[i]}"
+            for i in self.conflicts
+        ]
+        children = self.parent >= 0
+        totals = np.bincount(
+            self.parent[children],
+            weights=np.nan_to_num(self.weights[children]),
+            minlength=len(self.names),
+        )
+        has_children = np.bincount(self.parent[children], minlength=len(self.names)) > 0
+        for i in np.flatnonzero(has_children & (np.abs(totals - 100) > tolerance)):
+            warnings.append(
+                f"The weights of the categories under {self.names[i]} sum to "
+                f"{totals[i]:g} instead of 100"
+            )
+        return warnings
+
+    def render(self, leaves: list[tuple[int, str]] = ()) -> str:
+        """Draw the tree, with the extra `leaves` (node, label) under their node"""
+        labels = [self.names[0]] + [
+            f"{name} ({round(weight) if np.isfinite(weight) else '?'}%)"
+            for name, weight in zip(self.names[1:], self.weights[1:])
+        ]
+        parent = self.parent.tolist()
+        for node, label in leaves:
+            labels.append(label)
+            parent.append(node)
+
+        # Children of each node, sorted by label
+        children = [[] for _ in labels]
+        for i in sorted(range(1, len(labels)), key=labels.__getitem__):
+            children[parent[i]].append(i)
+
+        lines = []
+        stack = [(0, "", "")]
+        while stack:
+            node, prefix, branch = stack.pop()
+            lines.append(prefix + branch + labels[node])
+            if node:
+                prefix += "    " if branch == "└── " else "│   "
+            for rank, child in enumerate(reversed(children[node])):
+                stack.append((child, prefix, "└── " if rank == 0 else "├── "))
+        return "\n".join(lines)
@@ -0,0 +1,107 @@
+import importlib.util
+import os
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from .price_store import replacing
+
+# Format of the dates of the purchase history
+DATE_FORMAT = "%d/%m/%y"
+
+# Types of the columns of the purchase history, the tickers and currencies being few
+# distinct values repeated on every row
+DTYPES = {"yf_name": "category", "Unit": "category", "Quantity": "float64"}
+
+# Parquet is optional: without pyarrow, the CSV is parsed on every run
+HAS_PARQUET = importlib.util.find_spec("pyarrow") is not None
+
+
+def parse_dates(dates: pd.Series) -> pd.Series:
+    """Parse the dates of the history, each distinct date only once"""
+    dates = dates.astype("category")
+    parsed = pd.to_datetime(dates.cat.categories, format=DATE_FORMAT).to_numpy()
+    # A missing date has the code -1: the NaT appended at the end
+    parsed = np.append(parsed, np.datetime64("NaT", "ns"))
+    return pd.Series(parsed[dates.cat.codes], index=dates.index, name=dates.name)
+
+
+def iter_history(path: str, chunksize: int = 1_000_000):
+    """Read the purchase history by chunks of `chunksize` rows, typed and with parsed
+    dates"""
+    dtypes = {"Date": "category", **DTYPES}
+    for chunk in pd.read_csv(path, dtype=dtypes, chunksize=chunksize):
+        chunk["Date"] = parse_dates(chunk["Date"])
+        yield chunk
+
+
+def fold_holdings(chunks) -> pd.DataFrame:
+    """Total quantity of each (yf_name, Unit), summed chunk by chunk without keeping
+    the rows"""
+    holdings = None
+    for chunk in chunks:
+        quantity = chunk.groupby(["yf_name", "Unit"], observed=True)["Quantity"].sum()
+        holdings = (
+            quantity if holdings is None else holdings.add(quantity, fill_value=0)
+        )
+    if holdings is None:
+        return pd.DataFrame(columns=["yf_name", "Unit", "Quantity"])
+    return holdings.reset_index()
+
+
+def _concat(chunks: list[pd.DataFrame]) -> pd.DataFrame:
+    """Concatenate typed chunks, merging the categories found in each of them"""
+    for column in ("yf_name", "Unit"):
+        categories = union_categoricals([chunk[column] for chunk in chunks]).categories
+        for chunk in chunks:
+            chunk[column] = chunk[column].cat.set_categories(categories)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def _cache_path(path: str) -> str:
+    return os.path.splitext(path)[0] + ".parquet"
+
+
+def _cache_valid(path: str) -> bool:
+    cache_path = _cache_path(path)
+    return (
+        HAS_PARQUET
+        and os.path.exists(cache_path)
+        and os.path.getmtime(cache_path) >= os.path.getmtime(path)
+    )
+
+
+def read_holdings(path: str, chunksize: int = 1_000_000) -> pd.DataFrame:
+    """Total quantity of each (yf_name, Unit) of the purchase history at `path`,
+    folded chunk by chunk without keeping the rows (or read from the Parquet cache of
+    `read_history`, if up to date)"""
+    if _cache_valid(path):
+        columns = ["yf_name", "Unit", "Quantity"]
+        return fold_holdings(
+            [pd.read_parquet(_cache_path(path), engine="pyarrow", columns=columns)]
+        )
+    return fold_holdings(iter_history(path, chunksize))
+
+
+def read_history(
+    path: str, chunksize: int = 1_000_000, cache: bool = True
+) -> pd.DataFrame:
+    """Load the purchase history at `path` with typed columns and parsed dates.
+
+    The CSV is streamed by chunks. If pyarrow is installed and `cache`, the result is
+    also written to a Parquet file next to it, which is memory-mapped instead of
+    parsing the CSV again as long as the CSV does not change.
+    """
+    cache_path = _cache_path(path)
+    if cache and _cache_valid(path):
+        return pd.read_parquet(cache_path, engine="pyarrow", memory_map=True)
+
+    chunks = list(iter_history(path, chunksize))
+    if not chunks:
+        return pd.read_csv(path, dtype=DTYPES, parse_dates=["Date"])
+    purchase_history = _concat(chunks)
+    if cache and HAS_PARQUET:
+        with replacing(cache_path) as tmp_path:
+            purchase_history.to_parquet(tmp_path, engine="pyarrow", index=False)
+    return purchase_history
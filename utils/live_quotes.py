@@ -0,0 +1,91 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from rich import print
+
+from .profiler import PROFILER
+from .providers import DEFAULT_PROVIDER, QuoteProvider, retry
+
+
+class LiveQuotes:
+    """Latest (intraday) quote of each ticker, kept for `ttl` seconds.
+
+    The quotes are fetched by batch with `QuoteProvider.latest`, independently of the
+    daily history of the `PriceStore`. A quote older than `ttl` is still served, but
+    triggers a refresh of all the stale tickers in the background
+    (stale-while-revalidate). Only the tickers never fetched block the caller.
+    """
+
+    def __init__(
+        self,
+        provider: QuoteProvider = DEFAULT_PROVIDER,
+        ttl: float = 60,
+        retries: int = 3,
+    ):
+        self.provider = provider
+        self.ttl = ttl
+        self.retries = retries
+        self._quotes = {}
+        # Incremented by each fetch, for the results computed from the quotes to
+        # know they are outdated
+        self.version = 0
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=1)
+
+    def _fetch(self, tickers: list[str]) -> None:
+        latest = retry(self.provider.latest, tickers, retries=self.retries)
+        PROFILER.count("live_fetches")
+        now = time.monotonic()
+        with self._lock:
+            for ticker, value in latest.items():
+                self._quotes[ticker] = (float(value), now)
+            self.version += 1
+
+    def _revalidate(self, tickers: list[str]) -> None:
+        try:
+            self._fetch(tickers)
+        except Exception as e:
+            print(
+                f"[bold yellow]Warning:[/bold yellow] failed to refresh {tickers}: {e}"
+            )
+        finally:
+            with self._lock:
+                self._refreshing.difference_update(tickers)
+
+    def quotes(self, tickers) -> np.ndarray:
+        """Latest quote of each of `tickers` (1.0 for cash, "--")"""
+        tickers = np.asarray(tickers, dtype=object)
+        unique_tickers = [t for t in pd.unique(tickers) if t != "--"]
+        now = time.monotonic()
+        with self._lock:
+            missing = [t for t in unique_tickers if t not in self._quotes]
+            stale = [
+                t
+                for t in unique_tickers
+                if t in self._quotes
+                and now - self._quotes[t][1] >= self.ttl
+                and t not in self._refreshing
+            ]
+            self._refreshing.update(stale)
+        PROFILER.count("live_cache_hits", len(unique_tickers) - len(missing))
+        PROFILER.count("live_cache_misses", len(missing))
+
+        if stale:
+            self._pool.submit(self._revalidate, stale)
+        if missing:
+            self._fetch(missing)
+
+        with self._lock:
+            values = {t: self._quotes[t][0] for t in unique_tickers}
+        return np.array([values.get(t, 1.0) for t in tickers], dtype=float)
+
+    def quote(self, ticker: str) -> float:
+        return float(self.quotes([ticker])[0])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._quotes.clear()
@@ -0,0 +1,106 @@
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from .valuation import holdings_matrix
+
+METHODS = ("fifo", "lifo", "average")
+
+
+def match_lots(
+    purchase_history: pd.DataFrame, method: str = "fifo"
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Match the sells of the purchase history to the lots bought before them.
+
+    The transactions, valued with `price_transactions`, are processed in a single pass
+    in date order, keeping for each ticker a queue of its open lots (quantity, unit
+    cost in the reference currency). A sell consumes the oldest lots first ("fifo"),
+    the most recent ones ("lifo"), or the average cost of the position ("average").
+
+    Returns, for each transaction (same index as `purchase_history`), its realized
+    P&L and the change of the cost basis of the open position, then the open lots.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown cost basis method {method}, use one of {METHODS}")
+
+    order = np.argsort(purchase_history["Date"].to_numpy(), kind="stable")
+    tickers = purchase_history["yf_name"].to_numpy(dtype=object)[order]
+    quantities = purchase_history["Quantity"].to_numpy(dtype=float)[order]
+    unit_costs = (
+        purchase_history["unit_price"] * purchase_history["exchange_rate"]
+    ).to_numpy(dtype=float)[order]
+
+    realized = np.zeros(len(order))
+    cost_change = np.zeros(len(order))
+    lots = {}
+    for i, (ticker, quantity, unit_cost) in enumerate(
+        zip(tickers, quantities, unit_costs)
+    ):
+        queue = lots.setdefault(ticker, deque())
+        if quantity >= 0:
+            if method == "average" and queue:
+                held, cost = queue[0]
+                queue[0] = [held + quantity, cost + quantity * unit_cost]
+            else:
+                queue.append([quantity, quantity * unit_cost])
+            cost_change[i] = quantity * unit_cost
+            continue
+
+        # Consume the open lots, from the front (fifo, average) or the back (lifo)
+        to_sell, matched = -quantity, 0.0
+        while to_sell > 1e-12:
+            if not queue:
+                raise ValueError(
+                    f"{ticker} sold beyond the quantity held at transaction {order[i]}"
+                )
+            lot = queue[-1] if method == "lifo" else queue[0]
+            held, cost = lot
+            sold = min(held, to_sell)
+            matched += cost * sold / held
+            if sold < held:
+                lot[:] = [held - sold, cost * (held - sold) / held]
+            elif method == "lifo":
+                queue.pop()
+            else:
+                queue.popleft()
+            to_sell -= sold
+        realized[i] = -quantity * unit_cost - matched
+        cost_change[i] = -matched
+
+    matches = pd.DataFrame(
+        {"realized": realized, "cost_change": cost_change},
+        index=purchase_history.index[order],
+    ).reindex(purchase_history.index)
+    open_lots = pd.DataFrame(
+        [
+            (ticker, held, cost / held)
+            for ticker, queue in lots.items()
+            for held, cost in queue
+            if held > 1e-12
+        ],
+        columns=["yf_name", "Quantity", "unit_cost"],
+    )
+    return matches, open_lots
+
+
+def profit_and_loss(
+    purchase_history: pd.DataFrame,
+    values: pd.DataFrame,
+    method: str = "fifo",
+) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """Cumulative realized and unrealized P&L of each asset (columns) at each date of
+    the valuation `values`, and the open lots.
+
+    The realized P&L and cost basis changes of the transactions are accumulated over
+    the timeline like the holdings, and the unrealized P&L is the value of each
+    position minus its cost basis.
+    """
+    matches, open_lots = match_lots(purchase_history, method)
+    flows = purchase_history[["Date", "yf_name"]].join(matches)
+    realized = holdings_matrix(flows, values.index, column="realized")
+    cost_basis = holdings_matrix(flows, values.index, column="cost_change")
+    realized = realized.reindex(columns=values.columns, fill_value=0.0)
+    cost_basis = cost_basis.reindex(columns=values.columns, fill_value=0.0)
+    unrealized = values - cost_basis
+    return realized, unrealized, open_lots
@@ -1,10 +1,123 @@
+import numpy as np
 import pandas as pd
 from rich import print
 
+# Smallest amount of cash that can be held, for the cash lines ("--")
+CASH_LOT = 0.01
+
+
+def optimize_orders(
+    quantity: np.ndarray,
+    price: np.ndarray,
+    target: np.ndarray,
+    cash: np.ndarray,
+    lot_size: np.ndarray = 1.0,
+    min_order: float = 0.0,
+    fee_fixed: np.ndarray = 0.0,
+    fee_rate: np.ndarray = 0.0,
+    allow_sell: np.ndarray = True,
+    max_turnover: float = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Executable orders (whole lots) rebalancing the positions towards their targets.
+
+    `quantity`, `price` (in the reference currency), `target` (weights summing to 1),
+    `lot_size`, the fees and `allow_sell` are given per asset (or for all of them).
+    `cash` is a vector of cash influx scenarios, all solved at once with array
+    operations.
+
+    The fractional orders reaching the targets are scaled down to `max_turnover`
+    (traded value over portfolio value), the buys to what the cash and the sells can
+    pay for, then they are rounded to whole lots (the sells up, unless the turnover is
+    capped) and the orders smaller than `min_order` are dropped. The smallest buys are
+    given up while the cash left cannot pay for the fees. Then, by largest remainder,
+    one more lot is added to the assets whose remainder exceeds half a lot, as long as
+    the cash left pays for it and its fees, and the turnover stays within its cap.
+    Returns the shares to trade (scenarios x assets), the cash left and the fees paid
+    in each scenario.
+    """
+    quantity, price, target = (
+        np.asarray(x, dtype=float) for x in (quantity, price, target)
+    )
+    cash = np.atleast_1d(np.asarray(cash, dtype=float))
+    lot_size = np.broadcast_to(np.asarray(lot_size, dtype=float), price.shape)
+    allow_sell = np.broadcast_to(np.asarray(allow_sell, dtype=bool), price.shape)
+    fee_fixed = np.broadcast_to(np.asarray(fee_fixed, dtype=float), price.shape)
+    fee_rate = np.broadcast_to(np.asarray(fee_rate, dtype=float), price.shape)
+    lot_value = lot_size * price
+
+    # Fractional orders (in lots) reaching the targets in each scenario
+    total = quantity @ price + cash
+    value = target * total[:, None] - quantity * price
+    value = np.where(allow_sell, value, np.maximum(value, 0))
+    if max_turnover is not None:
+        traded = np.abs(value).sum(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scale = np.minimum(1, np.nan_to_num(max_turnover * total / traded, nan=1))
+        value *= scale[:, None]
+    # Scale the buys down to what the cash and the sells can pay for
+    buys = (np.maximum(value, 0) * (1 + fee_rate)).sum(axis=1)
+    budget = cash - (np.minimum(value, 0) * (1 - fee_rate)).sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scale = np.clip(np.nan_to_num(budget / buys, nan=1, posinf=1), 0, 1)
+    value = np.where(value > 0, value * scale[:, None], value)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        lots = np.nan_to_num(value / lot_value)
+    # Sells are rounded up to pay for the buys, but not beyond the capped turnover
+    base = np.floor(lots) if max_turnover is None else np.fix(lots)
+    # A sell must not be rounded beyond the existing position
+    base = np.maximum(base, -np.floor(quantity / lot_size))
+    # Drop the orders too small to be worth passing, before checking the cash
+    base[np.abs(base) * lot_value < min_order] = 0
+
+    def fees(n_lots):
+        traded = np.abs(n_lots) * lot_value
+        return fee_fixed * (n_lots != 0) + fee_rate * traded
+
+    def cash_left(n_lots):
+        return cash - (n_lots * lot_value + fees(n_lots)).sum(axis=1)
+
+    # Give up the smallest buys (or sells not paying for their fees) while the cash
+    # left is negative
+    left = cash_left(base)
+    while True:
+        costly = (base > 0) | (base * lot_value + fees(base) > 0)
+        order_value = np.where(costly, np.abs(base) * lot_value, np.inf)
+        short = (left < -1e-9) & np.isfinite(order_value.min(axis=1))
+        if not short.any():
+            break
+        base[short, order_value[short].argmin(axis=1)] = 0
+        left = cash_left(base)
+
+    # Largest remainder: round up the largest fractions while the cash and the
+    # turnover allow it, never to an order smaller than `min_order`
+    remainder = lots - base
+    extra_cost = lot_value * (1 + fee_rate) + fee_fixed * (base == 0)
+    rounded = np.abs(base + 1) * lot_value
+    candidate = (remainder > 0.5) & ((rounded >= min_order) | (base == -1))
+    order = np.argsort(-np.where(candidate, remainder, -np.inf), axis=1)
+    sorted_cost = np.take_along_axis(np.where(candidate, extra_cost, np.inf), order, 1)
+    accepted = np.cumsum(sorted_cost, axis=1) <= left[:, None]
+    if max_turnover is not None:
+        turnover_left = max_turnover * total - (np.abs(base) * lot_value).sum(axis=1)
+        sorted_traded = np.take_along_axis(np.where(candidate, lot_value, 0), order, 1)
+        accepted &= np.cumsum(sorted_traded, axis=1) <= turnover_left[:, None] + 1e-9
+    extra = np.zeros_like(base)
+    np.put_along_axis(extra, order, accepted.astype(float), axis=1)
+    n_lots = base + extra
+    return n_lots * lot_size, cash_left(n_lots), fees(n_lots).sum(axis=1)
+
 
 def get_list_of_orders(
-    assets_breakdown: pd.DataFrame, portfolio_breakdown: pd.DataFrame, currency: str
-):
+    assets_breakdown: pd.DataFrame,
+    portfolio_breakdown: pd.DataFrame,
+    currency: str,
+    min_order: float = 0.0,
+    fee_fixed: float = 0.0,
+    fee_rate: float = 0.0,
+    allow_sell: bool = True,
+    max_turnover: float = None,
+    verbose: bool = True,
+) -> pd.DataFrame:
     # Merge the two dataframes
     merged_df = assets_breakdown.merge(
         portfolio_breakdown, on="yf_name", how="outer", suffixes=("_real", "_desired")
@@ -12,18 +125,26 @@ def get_list_of_orders(
     merged_df = merged_df[merged_df["yf_name"] != "CASH"]
     merged_df.reset_index(drop=True, inplace=True)
 
+    # Assets held but absent from the ideal portfolio are priced with their real quote
+    for column in ["exchange_rate", "unit_price"]:
+        merged_df[f"{column}_desired"] = merged_df[f"{column}_desired"].fillna(
+            merged_df[f"{column}_real"]
+        )
+
     # Select the desired columns to create the df order
     total_invested = assets_breakdown[f"position_in_{currency}"].sum()
     order = merged_df[
         [
             "Product",
             "yf_name",
+            "Quantity",
             "p_overall_real",
             "p_overall_desired",
             "exchange_rate_desired",
             "unit_price_desired",
         ]
     ].copy()
+    order["Lot"] = merged_df["Lot"] if "Lot" in merged_df else np.nan
     order.rename(
         columns={
             "p_overall_real": "p_real",
@@ -34,12 +155,47 @@ def get_list_of_orders(
     order.fillna(0.0, inplace=True)
     order["difference"] = order["p_desired"] - order["p_real"]
     order[f"order_in_{currency}"] = order["difference"] * total_invested / 100
+
+    # Same orders valued in the other currencies of the breakdown, if any
+    other_currencies = [
+        column.removeprefix("position_in_")
+        for column in assets_breakdown.columns
+        if column.startswith("position_in_") and column != f"position_in_{currency}"
+    ]
+    for other in other_currencies:
+        total_other = assets_breakdown[f"position_in_{other}"].sum()
+        order[f"order_in_{other}"] = order[f"order_in_{currency}"] * (
+            total_other / total_invested
+        )
     order["order_in_shares"] = (
         order[f"order_in_{currency}"]
         / order["exchange_rate_desired"]
         / order["unit_price_desired"]
     )
 
+    # Round the orders to whole lots (one share unless a `Lot` is given), moving cash
+    # in and out of the cash lines is free
+    is_cash = order["yf_name"] == "--"
+    lot_size = np.where(is_cash, CASH_LOT, order["Lot"].replace(0, 1))
+    cash_influx = assets_breakdown.loc[
+        assets_breakdown["yf_name"] == "CASH", f"position_in_{currency}"
+    ].sum()
+    shares, cash_left, fees = optimize_orders(
+        order["Quantity"],
+        order["unit_price_desired"] * order["exchange_rate_desired"],
+        order["p_desired"] / order["p_desired"].sum(),
+        [cash_influx],
+        lot_size,
+        min_order=min_order,
+        fee_fixed=np.where(is_cash, 0, fee_fixed),
+        fee_rate=np.where(is_cash, 0, fee_rate),
+        allow_sell=allow_sell | is_cash,
+        max_turnover=max_turnover,
+    )
+    order["executable_shares"] = shares[0]
+    if not verbose:
+        return order
+
     print(
         "Orders to pass to rebalance the existing portfolio:\n",
         order[
@@ -49,7 +205,9 @@ def get_list_of_orders(
                 "p_desired",
                 "p_real",
                 f"order_in_{currency}",
+                *[f"order_in_{other}" for other in other_currencies],
                 "order_in_shares",
+                "executable_shares",
             ]
         ]
         .sort_values(by=f"order_in_{currency}", ascending=False, key=abs)
@@ -57,3 +215,6 @@ def get_list_of_orders(
         .reset_index(drop=True),
         "\n",
     )
+    print(f"Fees: {fees[0]:.2f}{currency}, cash left: {cash_left[0]:.2f}{currency}\n")
+
+    return order
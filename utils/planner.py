@@ -0,0 +1,70 @@
+import pandas as pd
+
+from .fx import ROOT_CURRENCY, fx_tickers
+from .quote_cache import DEFAULT_QUOTES, QuoteCache
+
+
+def _fx_tickers(currencies, ref_currencies: list[str]) -> list[str]:
+    """Base pairs needed to convert `currencies` to one or several reference
+    currencies, the latter through the root currency"""
+    if len(ref_currencies) == 1:
+        return fx_tickers(currencies, ref_currencies[0])
+    return fx_tickers([*currencies, *ref_currencies], ROOT_CURRENCY)
+
+
+def plan_fetches(
+    portfolio_structure: pd.DataFrame,
+    purchase_history: pd.DataFrame,
+    ref_currency: str | list[str],
+    history: bool = True,
+) -> dict:
+    """Find every ticker and exchange rate needed by a run, and the first date of its
+    history that is needed.
+
+    The ideal portfolio (if any) only needs the current quotes, while the purchase
+    history (if any) is valued from its first transaction on if `history`, or today
+    otherwise. `ref_currency` may be a list of reference currencies.
+    """
+    ref_currencies = [ref_currency] if isinstance(ref_currency, str) else ref_currency
+    today = pd.Timestamp.today().normalize()
+    starts = {}
+
+    def need(ticker: str, start: pd.Timestamp):
+        if ticker != "--" and not pd.isna(ticker):
+            starts[ticker] = min(start, starts.get(ticker, start))
+
+    if portfolio_structure is not None:
+        for ticker in [
+            *portfolio_structure["yf_name"].dropna().unique(),
+            *_fx_tickers(portfolio_structure["Unit"], ref_currencies),
+        ]:
+            need(ticker, today)
+
+    if purchase_history is not None and len(purchase_history):
+        first_date = purchase_history["Date"].min() if history else today
+        for ticker in [
+            *purchase_history["yf_name"].unique(),
+            *_fx_tickers(purchase_history["Unit"], ref_currencies),
+        ]:
+            need(ticker, first_date)
+
+    return starts
+
+
+def build_price_context(
+    portfolio_structure: pd.DataFrame,
+    purchase_history: pd.DataFrame,
+    ref_currency: str | list[str],
+    history: bool = True,
+    quotes: QuoteCache = DEFAULT_QUOTES,
+    verbose: bool = True,
+) -> QuoteCache:
+    """Fetch every series needed by a run exactly once, over its widest date range.
+
+    The returned cache is shared by all the later stages, which then only read the
+    series from memory.
+    """
+    starts = plan_fetches(portfolio_structure, purchase_history, ref_currency, history)
+    quotes.maxsize = max(quotes.maxsize, len(starts))
+    quotes.prefetch(starts, verbose=verbose)
+    return quotes
@@ -1,188 +1,208 @@
-import pandas as pd
-
+import os
 
-import matplotlib.pyplot as plt
 import numpy as np
-
-
-from .current_asset_value import (
-    get_last_quote,
-    exchange_rate,
-    invested_cash,
-    provide_breakdown_existing_assets,
-    load_data,
-)
-
-
-def _augment_timestamp(df: pd.DataFrame, first_date: pd.Timestamp = None):
-    """Augment the dataframe with a timestamp column"""
-    if first_date is None:
-        first_date = df["Date"].min()
+import pandas as pd
+from matplotlib.figure import Figure
+from rich import print
+
+from .history import DATE_FORMAT
+from .quote_cache import DEFAULT_QUOTES, QuoteCache
+from .snapshots import evaluate_with_snapshots
+from .valuation import evaluate_portfolio
+
+# Formats of the files that can be rendered without display
+OUTPUT_FORMATS = (".png", ".svg", ".html")
+
+
+def decimate(y: np.ndarray, n_buckets: int) -> np.ndarray:
+    """Rows to draw to keep the shape of each column of `y` (rows x series) with
+    about `n_buckets` buckets, e.g. one per pixel.
+
+    For each bucket of consecutive rows, its first and last rows and the rows of the
+    minimum and maximum of each series are kept, so that peaks are never lost.
+    Returns the sorted row indices (kept rows x series).
+    """
+    y = np.asarray(y, dtype=float)
+    y = y.reshape(len(y), -1)
+    n = len(y)
+    if n <= 4 * n_buckets:
+        return np.repeat(np.arange(n)[:, None], y.shape[1], axis=1)
+
+    # Pad the rows to a whole number of buckets of `size` rows
+    size = -(-n // n_buckets)
+    n_buckets = -(-n // size)
+    padded = np.full((n_buckets * size, y.shape[1]), np.nan)
+    padded[:n] = y
+    buckets = padded.reshape(n_buckets, size, -1)
+
+    # Missing values are never selected as an extremum, unless the bucket is empty
+    start = np.arange(n_buckets)[:, None] * size
+    lowest = start + np.argmin(np.where(np.isnan(buckets), np.inf, buckets), axis=1)
+    highest = start + np.argmax(np.where(np.isnan(buckets), -np.inf, buckets), axis=1)
+    first = np.broadcast_to(start, lowest.shape)
+    last = np.minimum(first + size - 1, n - 1)
+    rows = np.concatenate([first, lowest, highest, last])
+    return np.sort(np.minimum(rows, n - 1), axis=0)
+
+
+def group_small_positions(
+    frames: list[pd.DataFrame],
+    values: pd.DataFrame,
+    min_share: float = 0.02,
+    max_series: int = 20,
+) -> list[pd.DataFrame]:
+    """Sum the columns of each of `frames` whose position never weighs more than
+    `min_share` of the portfolio `values`, or beyond the `max_series` largest ones,
+    into an "other" column"""
+    total = values.sum(axis=1).replace(0, np.nan)
+    peak_share = values.div(total, axis=0).max().fillna(0).sort_values(ascending=False)
+    kept = peak_share.index[:max_series][peak_share.iloc[:max_series] >= min_share]
+    other = peak_share.index.difference(kept)
+    if other.empty:
+        return frames
+    return [frame[kept].assign(other=frame[other].sum(axis=1)) for frame in frames]
+
+
+def _plot(ax, x: pd.Index, y: pd.DataFrame, **kwargs):
+    """Draw each column of `y` against `x` with the shape of one point per pixel"""
+    rows = decimate(y.to_numpy(), max(int(ax.bbox.width), 1))
+    x = np.asarray(x)
+    for j, label in enumerate(y.columns):
+        ax.plot(x[rows[:, j]], y.iloc[rows[:, j], j], label=label, **kwargs)
+
+
+def _save(fig: Figure, output: str):
+    """Render `fig` without display, to PNG, SVG or HTML (an embedded SVG)"""
+    extension = os.path.splitext(output)[1].lower()
+    if extension not in OUTPUT_FORMATS:
+        raise ValueError(
+            f"Unknown plot format {extension}, use one of {OUTPUT_FORMATS}"
+        )
+    if extension == ".html":
+        svg = output[: -len(extension)] + ".svg"
+        fig.savefig(svg)
+        with open(svg) as f:
+            body = f.read()
+        os.remove(svg)
+        with open(output, "w") as f:
+            f.write(f"<!DOCTYPE html>\n<html><body>\n{body}\n</body></html>\n")
     else:
-        first_date = min(df["Date"].min(), first_date)
-    last_date = pd.Timestamp.today().normalize()
-    added_dates = pd.date_range(start=first_date, end=last_date, freq="W-MON")
-    df = pd.concat([df, pd.DataFrame({"Date": added_dates})])
-    df = df.sort_values(by="Date").ffill().fillna(0).reset_index(drop=True)
-    return df
-
-
-def plot_evolution_value(purchase_history: pd.DataFrame, ref_currency: str, verbose: bool = True):
-    # Be sure that dates can be used (TimesTamp format)
-    purchase_history["Date"] = pd.to_datetime(
-        purchase_history["Date"], format="%d/%m/%y"
-    )
-
-    # Get the amount of cash invested PER POSITION
-    purchase_history["unit_price"] = purchase_history.apply(
-        lambda x: get_last_quote(x["yf_name"], x["Date"], verbose=verbose), axis=1
-    )
-    purchase_history["exchange_rate"] = purchase_history.apply(
-        lambda x: exchange_rate(x["Unit"], ref_currency, x["Date"], verbose=verbose), axis=1
-    )
-    purchase_history["invested_cash"] = purchase_history.apply(invested_cash, axis=1)
-
-
-
-    # Get the amount of cash invested PER DATE
-    # Add inputs in df for each Monday since the beginning of the strategy
-    df_portfolio_value = (
-        purchase_history[["Date", "invested_cash"]].groupby("Date").sum().cumsum()
-    )
-    df_portfolio_value.reset_index(inplace=True)
-    df_portfolio_value = _augment_timestamp(df_portfolio_value)
-
-    # Get the value of the portfolio overtime PER DATE
-    for date in df_portfolio_value.Date.tolist():
-        # Keep the orders run before that date...
-        df_date = purchase_history[purchase_history["Date"] <= date].drop(
-            columns="Date"
+        fig.savefig(output)
+
+
+def plot_evolution_value(
+    purchase_history: pd.DataFrame,
+    ref_currency: str,
+    verbose: bool = True,
+    quotes: QuoteCache = DEFAULT_QUOTES,
+    output: str = None,
+    min_share: float = 0.02,
+    max_series: int = 20,
+    snapshot: str = None,
+    dtype=np.float64,
+):
+    """Plot the evolution of the portfolio and of its positions.
+
+    Shown in a window if `output` is None, else rendered headless to `output` (.png,
+    .svg or .html). The positions weighing less than `min_share` of the portfolio are
+    grouped into "other", and every line is decimated to about one point per pixel.
+    The valuation resumes from the `snapshot` file, if any, and its price matrices
+    are of `dtype`.
+    """
+    # Be sure that dates can be used (TimesTamp format), if not parsed when loaded
+    if not pd.api.types.is_datetime64_any_dtype(purchase_history["Date"]):
+        purchase_history["Date"] = pd.to_datetime(
+            purchase_history["Date"], format=DATE_FORMAT
         )
 
-        # ... and get the resulting breakdown at that Date, to get the portfolio value then
-        assets_breakdown = provide_breakdown_existing_assets(
-            df_date, 0, ref_currency, date=date, verbose=False
+    # Get the invested cash and the value of the portfolio overtime, as a whole and
+    # PER POSITION
+    if snapshot is not None:
+        df_portfolio_value, invested, values = evaluate_with_snapshots(
+            purchase_history,
+            ref_currency,
+            snapshot,
+            quotes=quotes,
+            verbose=verbose,
+            dtype=dtype,
         )
-        df_portfolio_value.loc[
-            df_portfolio_value["Date"] == date, "portfolio_value"
-        ] = assets_breakdown[f"position_in_{ref_currency}"].sum()
-
-    # Reproduce df_portfolio_value for each tag
-    histories = {}
-    for tag in purchase_history["yf_name"].unique():
-        histories[tag] = (
-            purchase_history[purchase_history["yf_name"] == tag][
-                ["Date", "Quantity", "invested_cash"]
-            ]
-            .groupby("Date")
-            .sum()
-            .cumsum()
-        )
-        histories[tag].reset_index(inplace=True)
-        histories[tag] = _augment_timestamp(
-            histories[tag], purchase_history["Date"].min()
+    else:
+        df_portfolio_value, invested, values = evaluate_portfolio(
+            purchase_history, ref_currency, quotes=quotes, verbose=verbose, dtype=dtype
         )
+    invested, values = group_small_positions(
+        [invested, values], values, min_share=min_share, max_series=max_series
+    )
 
-        if tag == "--":
-            histories[tag]["position_value"] = histories[tag]["Quantity"]
-        else:
-            history_tag = load_data(tag, purchase_history["Date"].min(), verbose=verbose)
-            histories[tag] = histories[tag].merge(
-                history_tag[["Date", "Close"]], on="Date", how="left"
-            )
-            histories[tag].loc[histories[tag]["Close"] == 0, "Close"] = np.nan
-            histories[tag] = histories[tag].ffill().fillna(0)
-            histories[tag].rename(columns={"Close": "position_value"}, inplace=True)
-            histories[tag]["position_value"] *= histories[tag]["Quantity"]
-
-        unit = purchase_history[purchase_history["yf_name"] == tag]["Unit"].iloc[0]
-        if unit != ref_currency:
-            history_unit = load_data(
-                f"{unit}{ref_currency}=x", purchase_history["Date"].min(), verbose=verbose
-            )[["Date", "Close"]]
-            histories[tag] = histories[tag].merge(
-                history_unit[["Date", "Close"]], on="Date", how="left"
-            )
-            histories[tag].rename(columns={"Close": "exchange_rate"}, inplace=True)
-            histories[tag]["position_value"] = (
-                histories[tag]["position_value"] * histories[tag]["exchange_rate"]
-            )
-
-    # Do the plot
+    # Do the plot, without display (and pyplot) when saved to a file
     # Two rows, one for the portfolio as a whole, one for the individual positions
-    fig, axes = plt.subplots(2, 3, figsize=(20, 10))
+    if output is None:
+        import matplotlib.pyplot as plt
+
+        fig, axes = plt.subplots(2, 3, figsize=(20, 10))
+    else:
+        fig = Figure(figsize=(20, 10))
+        axes = fig.subplots(2, 3)
 
     # OVERALL PORTFOLIO
     # Invested Cash vs Return vs Inflation vs Saving account
-    axes[0, 0].set_title("Evolution of the portfolio value")
-    axes[0, 0].plot(
-        df_portfolio_value["Date"],
-        df_portfolio_value["invested_cash"],
+    overall = df_portfolio_value.set_index("Date")
+    _plot(
+        axes[0, 0],
+        overall.index,
+        overall[["invested_cash"]].rename(columns={"invested_cash": "invested cash"}),
         drawstyle="steps-post",
-        label="invested cash",
     )
-    axes[0, 0].plot(
-        df_portfolio_value["Date"],
-        df_portfolio_value["portfolio_value"],
-        label="portfolio value",
+    _plot(
+        axes[0, 0],
+        overall.index,
+        overall[["portfolio_value"]].rename(
+            columns={"portfolio_value": "portfolio value"}
+        ),
     )
-    axes[0, 0].set_ylabel(f"Value (in {ref_currency})")
-    axes[0, 0].legend()
 
     # Benefits (in ref_currency)
-    axes[0, 1].set_title(f"Evolution of the benefits (in {ref_currency})")
-    axes[0, 1].plot(
-        df_portfolio_value["Date"],
-        df_portfolio_value["portfolio_value"] - df_portfolio_value["invested_cash"],
-        label="Benefits",
+    _plot(
+        axes[0, 1],
+        overall.index,
+        (overall["portfolio_value"] - overall["invested_cash"]).to_frame("Benefits"),
     )
-    axes[0, 1].axhline(0, color="black", linestyle="--", linewidth=0.75)
-    axes[0, 1].set_ylabel(f"Benefits (in {ref_currency})")
 
     # Yield (in %)
-    axes[0, 2].set_title("Portfolio yield (in %)")
-    axes[0, 2].plot(
-        df_portfolio_value["Date"],
-        100
-        * (df_portfolio_value["portfolio_value"] / df_portfolio_value["invested_cash"])
-        - 100,
-        label="Percentage",
+    _plot(
+        axes[0, 2],
+        overall.index,
+        (100 * overall["portfolio_value"] / overall["invested_cash"] - 100).to_frame(
+            "Percentage"
+        ),
     )
-    axes[0, 2].axhline(0, color="black", linestyle="--", linewidth=0.75)
-    axes[0, 2].set_ylabel("Percentage (in %)")
 
     # INDIVIDUAL POSITIONS
-    axes[1, 0].set_title("Evolution of the assets value")
-    for tag, df_tag in histories.items():
-        axes[1, 0].plot(
-            df_tag["Date"], df_tag["invested_cash"], drawstyle="steps-post", label=tag
-        )
-        # axes[0, 0].plot(df_portfolio_value["Date"], df_portfolio_value["portfolio_value"], label = "portfolio value")
-        axes[1, 0].set_ylabel(f"Value (in {ref_currency})")
-        axes[1, 0].legend()
-
-        axes[1, 1].set_title(f"Evolution of the benefits (in {ref_currency})")
-        axes[1, 1].plot(
-            df_tag["Date"],
-            df_tag["position_value"] - df_tag["invested_cash"],
-            label=tag,
-        )
-        axes[1, 1].axhline(0, color="black", linestyle="--", linewidth=0.75)
-        axes[1, 1].set_ylabel(f"Benefits (in {ref_currency})")
-
-        # Yield (in %)
-        axes[1, 2].set_title("Portfolio yield (in %)")
-        axes[1, 2].plot(
-            df_tag["Date"],
-            100 * (df_tag["position_value"] / df_tag["invested_cash"]) - 100,
-            label=tag,
-        )
-        axes[1, 2].axhline(0, color="black", linestyle="--", linewidth=0.75)
-        axes[1, 2].set_ylabel("Percentage (in %)")
-
+    _plot(axes[1, 0], invested.index, invested, drawstyle="steps-post")
+    _plot(axes[1, 1], values.index, values - invested)
+    _plot(axes[1, 2], values.index, 100 * (values / invested) - 100)
+
+    # Decorations, once per axis
+    for row, title in enumerate(
+        ["Evolution of the portfolio value", "Evolution of the assets value"]
+    ):
+        axes[row, 0].set_title(title)
+        axes[row, 0].set_ylabel(f"Value (in {ref_currency})")
+        axes[row, 1].set_title(f"Evolution of the benefits (in {ref_currency})")
+        axes[row, 1].set_ylabel(f"Benefits (in {ref_currency})")
+        axes[row, 2].set_title("Portfolio yield (in %)")
+        axes[row, 2].set_ylabel("Percentage (in %)")
+    axes[0, 0].legend()
+    axes[1, 0].legend()
+    for ax in axes[:, 1:].flatten():
+        ax.axhline(0, color="black", linestyle="--", linewidth=0.75)
     for ax in axes.flatten():
         ax.tick_params(axis="x", rotation=45)
         ax.grid(axis="y", linestyle="--", linewidth=0.5, color="lightgray")
 
     fig.tight_layout()
-    plt.show()
+    if output is None:
+        plt.show()
+    else:
+        _save(fig, output)
+        print(f"Plot saved to {output}")
@@ -0,0 +1,300 @@
+import json
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from rich import print
+
+from .profiler import PROFILER
+from .providers import DEFAULT_PROVIDER, QuoteProvider, fetch_concurrently, retry
+
+
+COLUMNS = ("Open", "High", "Low", "Close")
+
+# Extra history downloaded before the first requested date, so that a date falling
+# on a week-end or a bank holiday still has a close quote around it
+LOOKBACK = pd.Timedelta(days=31)
+
+
+class PriceStore:
+    """Columnar store of the daily history of each ticker.
+
+    Every ticker has its own folder `<root>/<ticker>/` with:
+    - `quotes.npy`: a single record of two fields, `dates` (the quote dates,
+      datetime64[ns], sorted, unique) and `ohlc` (a (4, n_dates) float64 array, one
+      contiguous row per column of `COLUMNS`), so that both are replaced at once,
+    - `meta.json`: the first date requested so far and the day of the last download.
+
+    Only the missing head (dates before the first requested one) and the missing tail
+    (days since the last download) are fetched, then merged into the store. Reads are
+    memory-mapped, so loading a history does not parse nor copy anything. The legacy
+    per-day CSV files of a ticker are folded into its store when it is first opened.
+    """
+
+    def __init__(
+        self,
+        root: str = "data",
+        provider: QuoteProvider = DEFAULT_PROVIDER,
+        retries: int = 3,
+        max_workers: int = 8,
+    ):
+        self.root = root
+        self.provider = provider
+        self.retries = retries
+        self.max_workers = max_workers
+
+    def _path(self, ticker: str, name: str) -> str:
+        return os.path.join(self.root, ticker, name)
+
+    def _read_meta(self, ticker: str) -> dict | None:
+        path = self._path(ticker, "meta.json")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            meta = json.load(f)
+        return {key: pd.Timestamp(value) for key, value in meta.items()}
+
+    def read(self, ticker: str) -> tuple[np.ndarray, np.ndarray] | None:
+        """Memory-map the stored `dates` and `ohlc` arrays of `ticker`"""
+        if self._read_meta(ticker) is None:
+            return None
+        quotes = _memmap(self._path(ticker, "quotes.npy"))
+        dates, ohlc = quotes["dates"], quotes["ohlc"]
+        PROFILER.count("bytes_read", dates.nbytes + ohlc.nbytes)
+        return dates, ohlc
+
+    def _write(
+        self, ticker: str, dates: np.ndarray, ohlc: np.ndarray, meta: dict
+    ) -> None:
+        """Atomically replace the arrays of `ticker`, open memory maps stay valid"""
+        os.makedirs(os.path.join(self.root, ticker), exist_ok=True)
+        # Both arrays go in one file, so that a reader never sees them from two writes
+        quotes = np.empty(
+            (),
+            dtype=[
+                ("dates", "datetime64[ns]", (len(dates),)),
+                ("ohlc", np.float64, (len(COLUMNS), len(dates))),
+            ],
+        )
+        quotes["dates"], quotes["ohlc"] = dates, ohlc
+        with replacing(self._path(ticker, "quotes.npy")) as tmp_path:
+            with open(tmp_path, "wb") as f:
+                np.save(f, quotes)
+        # The metadata is written last: it marks the arrays as complete
+        with replacing(self._path(ticker, "meta.json")) as tmp_path:
+            with open(tmp_path, "w") as f:
+                json.dump(
+                    {key: value.strftime("%Y-%m-%d") for key, value in meta.items()}, f
+                )
+
+    def _download(
+        self, ticker: str, start: pd.Timestamp, end: pd.Timestamp
+    ) -> tuple[np.ndarray, np.ndarray]:
+        history = retry(self.provider.history, ticker, start, end, retries=self.retries)
+        dates = history["Date"].to_numpy(dtype="datetime64[ns]")
+        ohlc = history[list(COLUMNS)].to_numpy(dtype=np.float64).T
+        PROFILER.count("network_fetches")
+        PROFILER.count("rows_fetched", len(dates))
+        return dates, ohlc
+
+    def ensure(
+        self,
+        ticker: str,
+        start: pd.Timestamp = None,
+        verbose: bool = True,
+        refresh: bool = False,
+    ) -> None:
+        """Make sure the history of `ticker` covers `start` up to today, downloading
+        the latest quotes again if `refresh` even if they were fetched today"""
+        today = pd.Timestamp.today().normalize()
+        start = today if start is None else pd.Timestamp(start).normalize()
+
+        meta = self._read_meta(ticker) or self._fold_csv(ticker, verbose=verbose)
+        if meta is None:
+            dates, ohlc = self._download(ticker, start - LOOKBACK, today)
+            self._write(ticker, dates, ohlc, {"start": start, "fetched": today})
+            if verbose:
+                print(f"Created store: {os.path.join(self.root, ticker)}")
+            return
+
+        missing_head = start < meta["start"]
+        missing_tail = refresh or meta["fetched"] < today
+        if not (missing_head or missing_tail):
+            if verbose:
+                print(f"Store up to date: {os.path.join(self.root, ticker)}")
+            return
+
+        stored_dates, stored_ohlc = self.read(ticker)
+        chunks = [(stored_dates, stored_ohlc)]
+        if missing_head:
+            first = stored_dates[0] if len(stored_dates) else meta["start"]
+            chunks.insert(
+                0, self._download(ticker, start - LOOKBACK, pd.Timestamp(first))
+            )
+        if missing_tail:
+            # Start from the last stored quote so that its (possibly intraday) close
+            # gets refreshed
+            last = stored_dates[-1] if len(stored_dates) else meta["fetched"]
+            chunks.append(self._download(ticker, pd.Timestamp(last), today))
+
+        dates, ohlc = _merge(chunks)
+        meta = {"start": min(start, meta["start"]), "fetched": today}
+        self._write(ticker, dates, ohlc, meta)
+        if verbose:
+            print(f"Updated store: {os.path.join(self.root, ticker)}")
+
+    def ensure_many(
+        self, starts: dict, verbose: bool = True, refresh: bool = False
+    ) -> dict:
+        """Concurrently `ensure` the history of each ticker of `starts` since its date.
+
+        Returns the exception raised for each ticker that could not be updated.
+        """
+        results = fetch_concurrently(
+            lambda ticker: self.ensure(
+                ticker, starts[ticker], verbose=verbose, refresh=refresh
+            ),
+            list(starts),
+            max_workers=self.max_workers,
+        )
+        return {k: v for k, v in results.items() if isinstance(v, Exception)}
+
+    def load(
+        self, ticker: str, start: pd.Timestamp = None, verbose: bool = True
+    ) -> pd.DataFrame:
+        """Get the history of `ticker` since `start` as a (zero-copy) DataFrame"""
+        self.ensure(ticker, start, verbose=verbose)
+        dates, ohlc = self.read(ticker)
+        ticker_history = pd.DataFrame(ohlc.T, columns=list(COLUMNS), copy=False)
+        ticker_history.insert(0, "Date", pd.DatetimeIndex(dates))
+        return ticker_history
+
+    def _fold_csv(self, ticker: str, verbose: bool = True) -> dict | None:
+        """Fold the legacy per-day CSV files of `ticker` into its store, and return
+        the metadata of the store"""
+        folder = os.path.join(self.root, ticker)
+        if not os.path.isdir(folder):
+            return None
+        csv_files = sorted(f for f in os.listdir(folder) if f.endswith(".csv"))
+        if not csv_files:
+            return self._read_meta(ticker)
+        chunks = []
+        for f in csv_files:
+            legacy = pd.read_csv(os.path.join(folder, f))
+            legacy["Date"] = pd.to_datetime(legacy["Date"])
+            chunks.append(
+                (
+                    legacy["Date"].to_numpy(dtype="datetime64[ns]"),
+                    legacy[list(COLUMNS)].to_numpy(dtype=np.float64).T,
+                )
+            )
+        stored = self.read(ticker)
+        if stored is not None:
+            chunks.append(stored)
+        dates, ohlc = _merge(chunks)
+        meta = self._read_meta(ticker)
+        if meta is None:
+            # The legacy files do not tell when they were downloaded
+            last = pd.Timestamp(dates[-1]).normalize()
+            meta = {"start": pd.Timestamp(dates[0]), "fetched": last}
+        self._write(ticker, dates, ohlc, meta)
+        for f in csv_files:
+            os.remove(os.path.join(folder, f))
+        if verbose:
+            print(f"Compacted {len(csv_files)} CSV files into: {folder}")
+        return meta
+
+    def compact(self, verbose: bool = True) -> None:
+        """Fold the legacy per-day CSV files of every ticker into its store"""
+        if not os.path.isdir(self.root):
+            return
+        for ticker in sorted(os.listdir(self.root)):
+            self._fold_csv(ticker, verbose=verbose)
+
+    def evict(
+        self,
+        before: pd.Timestamp = None,
+        max_idle_days: int = None,
+        verbose: bool = True,
+    ) -> None:
+        """Drop the quotes older than `before` (but the `LOOKBACK` window before it) and
+        the tickers not downloaded for `max_idle_days` days"""
+        if not os.path.isdir(self.root):
+            return
+        before = None if before is None else pd.Timestamp(before).normalize()
+        today = pd.Timestamp.today().normalize()
+        for ticker in sorted(os.listdir(self.root)):
+            meta = self._read_meta(ticker)
+            if meta is None:
+                continue
+            if (
+                max_idle_days is not None
+                and (today - meta["fetched"]).days > max_idle_days
+            ):
+                shutil.rmtree(os.path.join(self.root, ticker))
+                if verbose:
+                    print(f"Evicted store: {os.path.join(self.root, ticker)}")
+                continue
+            if before is not None and meta["start"] < before:
+                dates, ohlc = self.read(ticker)
+                keep = dates >= np.datetime64(before - LOOKBACK)
+                meta["start"] = before
+                self._write(ticker, dates[keep], ohlc[:, keep], meta)
+                if verbose:
+                    print(f"Trimmed store: {os.path.join(self.root, ticker)}")
+
+
+@contextmanager
+def replacing(path: str):
+    """Temporary file next to `path`, unique to the writer, moved over `path` once
+    written: concurrent writers never share a partial file"""
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path) or ".", prefix=os.path.basename(path), suffix=".tmp"
+    )
+    os.close(fd)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _memmap(path: str) -> np.memmap:
+    """Memory-map a .npy file from a single open, unlike `np.load` which opens it
+    again after reading the header: a file replaced in between stays consistent"""
+    with open(path, "rb") as f:
+        if np.lib.format.read_magic(f) == (1, 0):
+            header = np.lib.format.read_array_header_1_0(f)
+        else:
+            header = np.lib.format.read_array_header_2_0(f)
+        shape, fortran_order, dtype = header
+        return np.memmap(
+            f,
+            dtype=dtype,
+            mode="r",
+            shape=shape,
+            offset=f.tell(),
+            order="F" if fortran_order else "C",
+        )
+
+
+def _merge(
+    chunks: list[tuple[np.ndarray, np.ndarray]],
+) -> tuple[np.ndarray, np.ndarray]:
+    """Concatenate histories ordered from oldest to newest download, the most recent
+    quote wins for duplicated dates"""
+    dates = np.concatenate([np.asarray(d) for d, _ in chunks])
+    ohlc = np.concatenate([np.asarray(o) for _, o in chunks], axis=1)
+    # Keep the last occurrence of each date: `np.unique` returns the first one of the
+    # reversed arrays
+    _, idx = np.unique(dates[::-1], return_index=True)
+    idx = len(dates) - 1 - idx
+    return dates[idx], ohlc[:, idx]
+
+
+DEFAULT_STORE = PriceStore()
@@ -0,0 +1,81 @@
+import json
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+class Profiler:
+    """Wall-clock timers of the stages of a run, and counters of what they did.
+
+    Disabled by default, so that the instrumentation left in the code costs a single
+    test. `stage` accumulates the duration and number of calls of a named block,
+    `count` adds to a named counter (cache hits and misses, network fetches, bytes
+    read, rows processed, ...), and `report` also gives the peak memory of the process.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.stages = defaultdict(lambda: {"seconds": 0.0, "calls": 0})
+        self.counters = defaultdict(int)
+        self._start = time.perf_counter()
+
+    def start(self) -> None:
+        self.reset()
+        self.enabled = True
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time the block as the stage `name`"""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.stages[name]["seconds"] += time.perf_counter() - start
+                self.stages[name]["calls"] += 1
+
+    def count(self, name: str, n: int = 1) -> None:
+        """Add `n` to the counter `name`"""
+        if self.enabled:
+            with self._lock:
+                self.counters[name] += int(n)
+
+    def report(self) -> dict:
+        peak_memory = None
+        if resource is not None:
+            # Bytes on macOS, kilobytes elsewhere
+            peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            if sys.platform != "darwin":
+                peak_memory *= 1024
+        return {
+            "total_seconds": time.perf_counter() - self._start,
+            "stages": dict(self.stages),
+            "counters": dict(self.counters),
+            "peak_memory_bytes": peak_memory,
+        }
+
+    def dump(self, path: str) -> None:
+        """Write the `report` as JSON to `path` ("-" for the standard output)"""
+        report = json.dumps(self.report(), indent=2)
+        if path == "-":
+            print(report)
+            return
+        with open(path, "w") as f:
+            f.write(report + "\n")
+
+
+PROFILER = Profiler()
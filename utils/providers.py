@@ -0,0 +1,115 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+
+class QuoteProvider:
+    """Source of the daily history of tickers (quotes and exchange rates)"""
+
+    def history(
+        self, ticker: str, start: pd.Timestamp, end: pd.Timestamp
+    ) -> pd.DataFrame:
+        """Get the df of the history of `ticker` from `start` to `end` (both included),
+        with at least the columns Date, Open, High, Low and Close"""
+        raise NotImplementedError
+
+    def latest(self, tickers: list[str]) -> dict:
+        """Get the latest quote of each of `tickers`, by default the last close of its
+        recent history"""
+        today = pd.Timestamp.today().normalize()
+        latest = {}
+        for ticker in tickers:
+            ticker_history = self.history(ticker, today - pd.Timedelta(days=7), today)
+            latest[ticker] = float(ticker_history["Close"].iloc[-1])
+        return latest
+
+
+class YahooProvider(QuoteProvider):
+    """Quotes downloaded from Yahoo Finance"""
+
+    def history(
+        self, ticker: str, start: pd.Timestamp, end: pd.Timestamp
+    ) -> pd.DataFrame:
+        # Imported here as it is slow to import and only needed on a cache miss
+        import yfinance as yf
+
+        try:
+            ticker_yahoo = yf.Ticker(ticker)
+        except Exception as e:
+            raise Exception(f"Failed to retrieve data for ticker {ticker}: {e}")
+
+        ticker_history = ticker_yahoo.history(
+            start=start.strftime("%Y-%m-%d"),
+            end=(end + pd.Timedelta(days=1)).strftime("%Y-%m-%d"),
+        )
+        ticker_history.index = ticker_history.index.tz_localize(None)
+        ticker_history.reset_index(inplace=True)
+
+        return ticker_history
+
+    def latest(self, tickers: list[str]) -> dict:
+        # A single request for the intraday quotes of all the tickers
+        import yfinance as yf
+
+        intraday = yf.download(
+            list(tickers), period="5d", interval="1m", progress=False, group_by="column"
+        )["Close"]
+        if isinstance(intraday, pd.Series):
+            intraday = intraday.to_frame(tickers[0])
+        last = intraday.reindex(columns=list(tickers)).ffill().iloc[-1]
+        missing = last.index[last.isna()].tolist()
+        if missing:
+            raise Exception(f"No intraday quote for tickers {', '.join(missing)}")
+        return last.to_dict()
+
+
+class FixtureProvider(QuoteProvider):
+    """Quotes read from local `<root>/<ticker>.csv` files, e.g. for offline tests"""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def history(
+        self, ticker: str, start: pd.Timestamp, end: pd.Timestamp
+    ) -> pd.DataFrame:
+        path = os.path.join(self.root, ticker + ".csv")
+        if not os.path.exists(path):
+            raise Exception(f"No fixture for ticker {ticker}: {path}")
+        ticker_history = pd.read_csv(path, parse_dates=["Date"])
+        in_range = ticker_history["Date"].between(start, end)
+        return ticker_history[in_range].reset_index(drop=True)
+
+
+def retry(fn, *args, retries: int = 3, backoff: float = 0.5):
+    """Call `fn(*args)`, retrying up to `retries` times with an exponential backoff"""
+    for attempt in range(retries + 1):
+        try:
+            return fn(*args)
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2**attempt)
+
+
+def fetch_concurrently(fn, keys: list, max_workers: int = 8) -> dict:
+    """Call `fn(key)` for each unique key through a bounded thread pool.
+
+    Returns the result, or the raised exception, of each key.
+    """
+    keys = list(dict.fromkeys(keys))
+    results = {}
+    if not keys:
+        return results
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(keys))) as pool:
+        futures = {key: pool.submit(fn, key) for key in keys}
+        for key, future in futures.items():
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                results[key] = e
+    return results
+
+
+DEFAULT_PROVIDER = YahooProvider()
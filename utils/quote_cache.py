@@ -0,0 +1,257 @@
+from collections import OrderedDict
+from contextlib import nullcontext
+
+import numpy as np
+import pandas as pd
+
+from .compact import TICKERS, PriceMatrix
+from .price_store import DEFAULT_STORE, LOOKBACK, PriceStore
+from .profiler import PROFILER
+
+
+def to_ns(dates) -> np.ndarray:
+    """Convert dates (None meaning today) to an int64 array of nanoseconds"""
+    dates = pd.to_datetime(pd.Series(dates)).fillna(pd.Timestamp.today().normalize())
+    return dates.to_numpy(dtype="datetime64[ns]").view(np.int64)
+
+
+def _day(date: pd.Timestamp = None) -> pd.Timestamp:
+    """Normalize `date`, None meaning today"""
+    if date is None:
+        return pd.Timestamp.today().normalize()
+    return pd.Timestamp(date).normalize()
+
+
+def lookup(dates: np.ndarray, values: np.ndarray, when: np.ndarray, method: str):
+    """Find the values at `when` in the sorted series (`dates`, `values`)
+
+    - "nearest": value at the closest date, before or after `when`,
+    - "asof": last value known at `when` (the first one if `when` is too early).
+    """
+    if len(dates) == 0:
+        return np.full(len(when), np.nan)
+
+    idx = np.searchsorted(dates, when, side="right")
+    before = np.clip(idx - 1, 0, len(dates) - 1)
+    if method == "asof":
+        return values[before]
+    if method != "nearest":
+        raise ValueError(f"Unknown lookup method: {method}")
+    after = np.clip(idx, 0, len(dates) - 1)
+    use_after = np.abs(dates[after] - when) < np.abs(when - dates[before])
+    return values[np.where(use_after, after, before)]
+
+
+def ffill(values: np.ndarray) -> None:
+    """Replace in place each null or NaN value of `values` by the last valid one
+    before it, 0 before the first one"""
+    valid = (values != 0) & ~np.isnan(values)
+    if valid.all():
+        return
+    last = np.where(valid, np.arange(len(values)), -1)
+    np.maximum.accumulate(last, out=last)
+    filled = values[np.maximum(last, 0)]
+    filled[last < 0] = 0
+    values[:] = filled
+
+
+class QuoteCache:
+    """In-memory LRU of the close series of the most recently used tickers.
+
+    Each entry keeps the sorted quote dates (int64 ns) and the close prices since the
+    first requested date, read from the memory-mapped `PriceStore`, so a lookup is a
+    `searchsorted` instead of a scan of the whole history.
+
+    If `live` quotes are given, the quotes of today are read from them instead, and
+    the daily history of the store is neither read nor updated for today only.
+    """
+
+    def __init__(
+        self, store: PriceStore = DEFAULT_STORE, maxsize: int = 256, live=None
+    ):
+        self.store = store
+        self.maxsize = maxsize
+        self.live = live
+        self._series = OrderedDict()
+
+    def _missing_start(self, ticker: str, start: pd.Timestamp) -> pd.Timestamp | None:
+        """First date to load for `ticker`, None if its cached series covers `start`"""
+        entry = self._series.get(ticker)
+        if entry is None:
+            return start
+        if entry[0] <= start:
+            return None
+        return min(start, entry[0])
+
+    def _load(self, ticker: str, start: pd.Timestamp) -> tuple[np.ndarray, np.ndarray]:
+        dates, ohlc = self.store.read(ticker)
+        # Copy the window needed only, as each memory map holds a file descriptor
+        # until released: thousands of cached tickers would exhaust them
+        first = np.searchsorted(dates, (start - LOOKBACK).to_datetime64())
+        dates, close = np.array(dates[first:]).view(np.int64), np.array(ohlc[3, first:])
+        self._series[ticker] = (start, dates, close)
+        self._series.move_to_end(ticker)
+        if len(self._series) > self.maxsize:
+            self._series.popitem(last=False)
+        return dates, close
+
+    def series(
+        self, ticker: str, start: pd.Timestamp = None, verbose: bool = True
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Get the (dates, close) series of `ticker`, covering `start` to today"""
+        start = _day(start)
+        missing_start = self._missing_start(ticker, start)
+        if missing_start is None:
+            PROFILER.count("quote_cache_hits")
+            # Read the entry once, it may be replaced by a concurrent `refresh`
+            _, dates, close = self._series[ticker]
+            self._series.move_to_end(ticker)
+            return dates, close
+
+        PROFILER.count("quote_cache_misses")
+        self.store.ensure(ticker, missing_start, verbose=verbose)
+        return self._load(ticker, missing_start)
+
+    def prefetch(self, starts: dict, verbose: bool = True) -> None:
+        """Load the series of each ticker of `starts` since its date, the tickers
+        missing from the store being downloaded concurrently"""
+        missing = {}
+        today = _day()
+        if self.live is not None:
+            starts = {t: s for t, s in starts.items() if _day(s) < today}
+        for ticker, start in starts.items():
+            missing_start = self._missing_start(ticker, _day(start))
+            if ticker != "--" and missing_start is not None:
+                missing[ticker] = missing_start
+        PROFILER.count("quote_cache_hits", len(starts) - len(missing))
+        PROFILER.count("quote_cache_misses", len(missing))
+
+        errors = self.store.ensure_many(missing, verbose=verbose)
+        if errors:
+            raise Exception(
+                "Failed to retrieve data for tickers "
+                + ", ".join(f"{ticker} ({e})" for ticker, e in errors.items())
+            )
+        for ticker, start in missing.items():
+            self._load(ticker, start)
+
+    def quote(
+        self,
+        ticker: str,
+        date: pd.Timestamp = None,
+        method: str = "nearest",
+        verbose: bool = True,
+    ) -> float:
+        """Close of `ticker` at `date` (the last one if `date` is None)"""
+        if ticker == "--":
+            return 1.0
+        if self.live is not None and _day(date) >= _day():
+            return self.live.quote(ticker)
+        dates, close = self.series(ticker, date, verbose=verbose)
+        if date is None:
+            return float(close[-1])
+        return float(lookup(dates, close, to_ns([date]), method)[0])
+
+    def quotes(
+        self, tickers, dates=None, method: str = "nearest", verbose: bool = True
+    ) -> np.ndarray:
+        """Vectorized `quote` over aligned arrays of tickers and dates"""
+        when = to_ns([None] * len(tickers) if dates is None else dates)
+        if self.live is not None:
+            today = when >= to_ns([None])[0]
+            if today.any():
+                tickers = np.asarray(tickers, dtype=object)
+                result = np.empty(len(tickers))
+                result[today] = self.live.quotes(tickers[today])
+                past = ~today
+                if past.any():
+                    result[past] = self.quotes(
+                        tickers[past], pd.to_datetime(when[past]), method, verbose
+                    )
+                return result
+        # Each distinct ticker is hashed once, the rows being grouped by their code
+        # (missing tickers being left out, like the cash)
+        interned = TICKERS.codes(tickers)
+        codes, unique_codes = pd.factorize(
+            pd.arrays.IntegerArray(interned, interned < 0)
+        )
+        unique_tickers = TICKERS.decode(unique_codes.to_numpy())
+        first_dates = np.full(len(unique_tickers), np.iinfo(np.int64).max)
+        np.minimum.at(first_dates, codes, when)
+        self.prefetch(
+            dict(zip(unique_tickers, pd.to_datetime(first_dates))), verbose=verbose
+        )
+
+        result = np.ones(len(tickers))
+        for code, ticker in enumerate(unique_tickers):
+            if ticker == "--":
+                continue
+            rows = codes == code
+            ticker_dates, close = self.series(
+                ticker, pd.Timestamp(first_dates[code]), verbose=verbose
+            )
+            result[rows] = lookup(ticker_dates, close, when[rows], method)
+        return result
+
+    def matrix(
+        self,
+        tickers: list[str],
+        dates: pd.DatetimeIndex,
+        verbose: bool = True,
+        dtype=np.float64,
+        out: np.ndarray = None,
+    ) -> np.ndarray:
+        """Last close known at each of `dates` (rows) for each of `tickers` (columns).
+
+        The matrix is column-major, so that each ticker is written in place as one
+        contiguous column, into `out` (e.g. a memory-mapped file) if given.
+        """
+        when = to_ns(dates)
+        self.prefetch({ticker: dates[0] for ticker in tickers}, verbose=verbose)
+        shape = (len(dates), len(tickers))
+        prices = np.empty(shape, dtype=dtype, order="F") if out is None else out
+        for i, ticker in enumerate(tickers):
+            if ticker == "--":
+                prices[:, i] = 1.0
+                continue
+            ticker_dates, close = self.series(ticker, dates[0], verbose=verbose)
+            prices[:, i] = lookup(ticker_dates, close, when, "asof")
+            # A null close is a missing quote: use the previous one instead
+            ffill(prices[:, i])
+        return prices
+
+    def price_matrix(
+        self,
+        tickers: list[str],
+        dates: pd.DatetimeIndex,
+        verbose: bool = True,
+        dtype=np.float64,
+    ) -> PriceMatrix:
+        """`matrix` as a `PriceMatrix` of `dtype`, memory-mapped if large"""
+        prices = PriceMatrix.empty(dates, tickers, dtype=dtype)
+        self.matrix(tickers, dates, verbose=verbose, out=prices.values)
+        return prices
+
+    def refresh(self, verbose: bool = True, lock=None) -> dict:
+        """Download the latest quotes of every cached ticker, then reload their series
+        (holding `lock`, if any, only while the cache is updated). With `live` quotes,
+        the daily history is only completed up to yesterday, never downloaded again
+        for today.
+
+        Returns the exception raised for each ticker that could not be refreshed.
+        """
+        starts = {ticker: entry[0] for ticker, entry in list(self._series.items())}
+        errors = self.store.ensure_many(
+            starts, verbose=verbose, refresh=self.live is None
+        )
+        with lock or nullcontext():
+            for ticker, start in starts.items():
+                if ticker not in errors:
+                    self._load(ticker, start)
+        return errors
+
+    def clear(self) -> None:
+        self._series.clear()
+
+
+DEFAULT_QUOTES = QuoteCache()
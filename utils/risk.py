@@ -0,0 +1,161 @@
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+TRADING_DAYS = 252
+
+
+def returns_matrix(prices: pd.DataFrame) -> pd.DataFrame:
+    """Daily returns of aligned `prices` (dates x assets). A missing or null price is
+    the previous known one, so an asset not listed yet has null returns."""
+    p = prices.replace(0, np.nan).bfill().ffill().fillna(1)
+    return pd.DataFrame(
+        p.to_numpy()[1:] / p.to_numpy()[:-1] - 1,
+        index=prices.index[1:],
+        columns=prices.columns,
+    )
+
+
+def _as_array(x) -> np.ndarray:
+    x = np.asarray(x, dtype=float)
+    return x[:, None] if x.ndim == 1 else x
+
+
+def volatility(returns, annualize: bool = True) -> np.ndarray:
+    """Standard deviation of each column of `returns`"""
+    std = _as_array(returns).std(axis=0, ddof=1)
+    return std * np.sqrt(TRADING_DAYS) if annualize else std
+
+
+def covariance(returns, annualize: bool = True) -> np.ndarray:
+    """Covariance matrix (assets x assets) of the columns of `returns`"""
+    x = _as_array(returns)
+    centered = x - x.mean(axis=0)
+    cov = centered.T @ centered / (len(x) - 1)
+    return cov * TRADING_DAYS if annualize else cov
+
+
+def correlation(returns) -> np.ndarray:
+    """Correlation matrix (assets x assets) of the columns of `returns`"""
+    cov = covariance(returns, annualize=False)
+    std = np.sqrt(np.diag(cov))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return cov / np.outer(std, std)
+
+
+def tracking_error(returns, weights, benchmark_weights, annualize: bool = True):
+    """Volatility of the returns of the `weights` portfolio in excess of the
+    `benchmark_weights` one, both kept constant (i.e. rebalanced daily)"""
+    active = _as_array(returns) @ (np.asarray(weights) - np.asarray(benchmark_weights))
+    return float(volatility(active, annualize)[0])
+
+
+def max_drawdown(returns) -> np.ndarray:
+    """Largest loss (in [0, 1]) from a previous peak of each column of `returns`"""
+    growth = np.cumprod(1 + _as_array(returns), axis=0)
+    return (1 - growth / np.maximum.accumulate(growth, axis=0)).max(axis=0)
+
+
+def historical_var(returns, alpha: float = 0.05) -> np.ndarray:
+    """Daily loss exceeded with probability `alpha`, from the observed returns"""
+    return -np.quantile(_as_array(returns), alpha, axis=0)
+
+
+def parametric_var(returns, alpha: float = 0.05) -> np.ndarray:
+    """Daily loss exceeded with probability `alpha`, for normal returns"""
+    x = _as_array(returns)
+    z = NormalDist().inv_cdf(alpha)
+    return -(x.mean(axis=0) + z * x.std(axis=0, ddof=1))
+
+
+def _rolling_moments(x: np.ndarray, window: int) -> tuple[np.ndarray, np.ndarray]:
+    """Mean and (unbiased) variance over each window of `window` rows ending at each
+    row, from running sums: one pass whatever the window length. The first
+    `window - 1` rows are NaN."""
+    x = _as_array(x)
+    # Centering on the column means limits the cancellation in the running sums
+    x = x - x.mean(axis=0)
+    zeros = np.zeros((1, x.shape[1]))
+    s1 = np.concatenate([zeros, np.cumsum(x, axis=0)])
+    s2 = np.concatenate([zeros, np.cumsum(x * x, axis=0)])
+    n = len(x)
+    mean = np.full(x.shape, np.nan)
+    var = np.full(x.shape, np.nan)
+    if window <= n:
+        w1 = s1[window:] - s1[:-window]
+        w2 = s2[window:] - s2[:-window]
+        mean[window - 1 :] = w1 / window
+        var[window - 1 :] = np.maximum(w2 - w1 * w1 / window, 0) / (window - 1)
+    return mean, var
+
+
+def rolling_volatility(returns, window: int = 63, annualize: bool = True):
+    """`volatility` over each window of `window` days"""
+    _, var = _rolling_moments(returns, window)
+    std = np.sqrt(var)
+    return std * np.sqrt(TRADING_DAYS) if annualize else std
+
+
+def rolling_covariance(x, y, window: int = 63, annualize: bool = True) -> np.ndarray:
+    """Covariance of each column of `x` with the matching column of `y` over each
+    window, from the running sums of x, y and x*y"""
+    x, y = _as_array(x), _as_array(y)
+    x, y = x - x.mean(axis=0), y - y.mean(axis=0)
+    zeros = np.zeros((1, x.shape[1]))
+    sx, sy, sxy = (np.concatenate([zeros, np.cumsum(a, axis=0)]) for a in (x, y, x * y))
+    cov = np.full(x.shape, np.nan)
+    if window <= len(x):
+        wx, wy = sx[window:] - sx[:-window], sy[window:] - sy[:-window]
+        wxy = sxy[window:] - sxy[:-window]
+        cov[window - 1 :] = (wxy - wx * wy / window) / (window - 1)
+    return cov * TRADING_DAYS if annualize else cov
+
+
+def rolling_tracking_error(
+    returns, weights, benchmark_weights, window: int = 63, annualize: bool = True
+) -> np.ndarray:
+    """`tracking_error` over each window of `window` days"""
+    active = _as_array(returns) @ (np.asarray(weights) - np.asarray(benchmark_weights))
+    return rolling_volatility(active, window, annualize)[:, 0]
+
+
+def rolling_parametric_var(returns, window: int = 63, alpha: float = 0.05):
+    """`parametric_var` over each window of `window` days"""
+    x = _as_array(returns)
+    mean, var = _rolling_moments(x, window)
+    # The moments are computed on centered returns
+    mean = mean + x.mean(axis=0)
+    return -(mean + NormalDist().inv_cdf(alpha) * np.sqrt(var))
+
+
+def risk_report(
+    returns: pd.DataFrame,
+    portfolios: dict[str, pd.Series],
+    benchmark: str = None,
+    alpha: float = 0.05,
+) -> pd.DataFrame:
+    """Risk metrics of each of the `portfolios` (name: weight of each asset), kept at
+    constant weights over `returns`, all evaluated with one matrix product"""
+    weights = np.column_stack(
+        [
+            w.reindex(returns.columns, fill_value=0).to_numpy(dtype=float)
+            for w in portfolios.values()
+        ]
+    )
+    portfolio_returns = returns.to_numpy() @ weights
+    report = pd.DataFrame(
+        {
+            "annual_return": portfolio_returns.mean(axis=0) * TRADING_DAYS,
+            "annual_volatility": volatility(portfolio_returns),
+            "max_drawdown": max_drawdown(portfolio_returns),
+            f"historical_var_{alpha:g}": historical_var(portfolio_returns, alpha),
+            f"parametric_var_{alpha:g}": parametric_var(portfolio_returns, alpha),
+        },
+        index=list(portfolios),
+    )
+    if benchmark is not None:
+        column = list(portfolios).index(benchmark)
+        active = portfolio_returns - portfolio_returns[:, [column]]
+        report[f"tracking_error_vs_{benchmark}"] = volatility(active)
+    return report
@@ -0,0 +1,267 @@
+import json
+import os
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+from rich import print
+
+from .current_asset_value import (
+    access_current_asset_value,
+    provide_breakdown_existing_assets,
+)
+from .format_ideal_portfolio import read_portfolio
+from .history import read_history
+from .orders import get_list_of_orders
+from .planner import build_price_context
+from .quote_cache import DEFAULT_QUOTES, QuoteCache
+from .valuation import evaluate_portfolio
+
+# Options of the `orders` query, with their type
+ORDER_OPTIONS = {
+    "min_order": float,
+    "fee_fixed": float,
+    "fee_rate": float,
+    "allow_sell": lambda x: x.lower() not in ("0", "false", "no"),
+    "max_turnover": float,
+}
+
+
+class PortfolioService:
+    """Portfolio kept in memory to answer many queries without starting cold.
+
+    The ideal portfolio and the holdings are parsed once (and again only when their
+    file changes), the transactions of the history only at the first valuation, their price series stay in the `QuoteCache`, and the result
+    of each query is memoized until the next refresh of the quotes, which runs every
+    `refresh_interval` seconds in a background thread. With live quotes, a result is
+    also computed again once older than their `ttl`, or once they were fetched again.
+    """
+
+    def __init__(
+        self,
+        path_portfolio: str,
+        ref_currency: str,
+        quotes: QuoteCache = DEFAULT_QUOTES,
+        refresh_interval: float = 900,
+    ):
+        self.path_portfolio = path_portfolio
+        self.ref_currency = ref_currency
+        self.quotes = quotes
+        self.refresh_interval = refresh_interval
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._mtimes = None
+        self._results = {}
+
+    def _paths(self) -> list[str]:
+        return [
+            os.path.join(self.path_portfolio, "_ideal_portfolio.csv"),
+            os.path.join(self.path_portfolio, "_history.csv"),
+        ]
+
+    def _load(self) -> None:
+        """(Re)load the portfolio if one of its files changed since the last load"""
+        mtimes = [os.path.getmtime(path) for path in self._paths()]
+        if mtimes == self._mtimes:
+            return
+
+        portfolio_structure, holdings = read_portfolio(
+            self.path_portfolio, holdings=True
+        )
+        build_price_context(
+            portfolio_structure,
+            holdings,
+            self.ref_currency,
+            history=False,
+            quotes=self.quotes,
+            verbose=False,
+        )
+
+        self.portfolio_structure = portfolio_structure
+        self.holdings = holdings
+        self.purchase_history = None
+        self._mtimes = mtimes
+        self._results.clear()
+
+    def _expired(self, computed_at: float, version: int) -> bool:
+        live = self.quotes.live
+        if live is None:
+            return False
+        return version != live.version or time.monotonic() - computed_at >= live.ttl
+
+    def _cached(self, key: tuple, compute):
+        with self._lock:
+            self._load()
+            if key not in self._results or self._expired(*self._results[key][:2]):
+                live = self.quotes.live
+                version = live.version if live is not None else 0
+                computed_at = time.monotonic()
+                result = compute()
+                self._results[key] = (computed_at, version, result)
+            return self._results[key][2]
+
+    def breakdown(self, investment: float = 0.0) -> pd.DataFrame:
+        """Existing positions, as `provide_breakdown_existing_assets`"""
+        return self._cached(
+            ("breakdown", investment),
+            lambda: provide_breakdown_existing_assets(
+                self.holdings,
+                investment,
+                self.ref_currency,
+                verbose=False,
+                quotes=self.quotes,
+            ),
+        )
+
+    def orders(self, investment: float = 0.0, **options) -> pd.DataFrame:
+        """Orders rebalancing the portfolio, as `get_list_of_orders`"""
+
+        def compute():
+            access_current_asset_value(
+                self.portfolio_structure,
+                self.ref_currency,
+                verbose=False,
+                quotes=self.quotes,
+            )
+            return get_list_of_orders(
+                self.breakdown(investment),
+                self.portfolio_structure,
+                self.ref_currency,
+                verbose=False,
+                **options,
+            )
+
+        return self._cached(("orders", investment, *sorted(options.items())), compute)
+
+    def valuation(self) -> pd.DataFrame:
+        """Invested cash and value of the portfolio over time"""
+
+        def compute():
+            if self.purchase_history is None:
+                self.purchase_history = read_history(self._paths()[1])
+                build_price_context(
+                    None,
+                    self.purchase_history,
+                    self.ref_currency,
+                    quotes=self.quotes,
+                    verbose=False,
+                )
+            return evaluate_portfolio(
+                self.purchase_history.copy(),
+                self.ref_currency,
+                quotes=self.quotes,
+                verbose=False,
+            )[0]
+
+        return self._cached(("valuation",), compute)
+
+    def refresh(self) -> dict:
+        """Download the latest quotes, then forget the results computed with the old
+        ones. Queries are only blocked while the cache is updated."""
+        errors = self.quotes.refresh(verbose=False, lock=self._lock)
+        with self._lock:
+            self._results.clear()
+        return errors
+
+    def _run(self):
+        while not self._stop.wait(self.refresh_interval):
+            errors = self.refresh()
+            if errors:
+                print(f"[bold yellow]Warning:[/bold yellow] failed to refresh {errors}")
+
+    def start(self) -> None:
+        """Load the portfolio and start refreshing its quotes in the background"""
+        with self._lock:
+            self._load()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_handler(service: PortfolioService):
+    """HTTP handler answering `GET /<query>?<parameters>` with JSON records"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def address_string(self) -> str:
+            # Unix sockets have no client address
+            return self.client_address[0] if self.client_address else "unix"
+
+        def _send(self, status: int, body):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            try:
+                investment = float(params.pop("investment", 0.0))
+                if url.path == "/health":
+                    return self._send(200, {"status": "ok"})
+                if url.path == "/refresh":
+                    errors = {k: str(e) for k, e in service.refresh().items()}
+                    return self._send(200, {"errors": errors})
+                if url.path == "/breakdown":
+                    result = service.breakdown(investment)
+                elif url.path == "/orders":
+                    options = {k: ORDER_OPTIONS[k](v) for k, v in params.items()}
+                    result = service.orders(investment, **options)
+                elif url.path == "/valuation":
+                    result = service.valuation()
+                else:
+                    return self._send(404, {"error": f"Unknown query {url.path}"})
+            except (KeyError, ValueError) as e:
+                return self._send(400, {"error": f"Invalid parameter: {e}"})
+            except Exception as e:
+                return self._send(500, {"error": str(e)})
+            records = result.to_json(orient="records", date_format="iso")
+            self._send(200, json.loads(records))
+
+    return Handler
+
+
+def serve(
+    service: PortfolioService,
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    socket_path: str = None,
+):
+    """Answer the queries on `host:port`, or on the unix socket `socket_path`, until
+    interrupted"""
+    handler = make_handler(service)
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = _UnixHTTPServer(socket_path, handler)
+        address = socket_path
+    else:
+        server = ThreadingHTTPServer((host, port), handler)
+        address = f"http://{host}:{server.server_address[1]}"
+
+    service.start()
+    print(f"Serving {service.path_portfolio} on {address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+        if socket_path is not None and os.path.exists(socket_path):
+            os.remove(socket_path)
@@ -0,0 +1,171 @@
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+from pandas.util import hash_pandas_object
+
+from .price_store import DEFAULT_STORE, replacing
+from .profiler import PROFILER
+from .quote_cache import DEFAULT_QUOTES, QuoteCache
+from .valuation import (
+    holdings_matrix,
+    price_transactions,
+    summarize,
+    timeline,
+    value_holdings,
+)
+
+# Columns of the transactions covered by the hash of a snapshot
+HASHED_COLUMNS = ["Date", "yf_name", "Unit", "Quantity"]
+
+# Only the dates at least this old are checkpointed, as their quotes are final
+SETTLE_DAYS = 7
+
+
+def snapshot_path(history_path: str, ref_currency: str, root: str = None) -> str:
+    """File of the snapshots of the purchase history at `history_path`"""
+    root = os.path.join(DEFAULT_STORE.root, "_snapshots") if root is None else root
+    key = f"{os.path.abspath(history_path)}|{ref_currency}"
+    return os.path.join(root, hashlib.sha1(key.encode()).hexdigest() + ".npz")
+
+
+def prefix_hashes(row_hashes: np.ndarray, lengths) -> list[str]:
+    """Hash of the first `length` rows for each of the (sorted) `lengths`, in a single
+    pass over the row hashes"""
+    digest = hashlib.sha256()
+    hashes, done = [], 0
+    for length in lengths:
+        digest.update(row_hashes[done:length].tobytes())
+        done = length
+        hashes.append(digest.copy().hexdigest())
+    return hashes
+
+
+def _load(path: str) -> dict | None:
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as snapshot:
+        return {key: snapshot[key] for key in snapshot.files}
+
+
+def _save(path: str, **arrays) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with replacing(path) as tmp_path:
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+
+
+def _last_valid(
+    snapshot: dict, transaction_dates: np.ndarray, row_hashes: np.ndarray
+) -> tuple[pd.Timestamp, int] | None:
+    """Latest checkpoint (date, number of transactions) of `snapshot` still matching
+    the sorted transactions: same first rows, and no other row on or before it"""
+    rows = snapshot["cp_rows"]
+    covered = rows <= len(row_hashes)
+    current = prefix_hashes(row_hashes, rows[covered])
+    for date, n, saved, now in zip(
+        snapshot["cp_dates"][covered][::-1],
+        rows[covered][::-1],
+        snapshot["cp_hashes"][covered][::-1],
+        current[::-1],
+    ):
+        if saved == now and (
+            n == len(transaction_dates) or transaction_dates[n] > date
+        ):
+            return pd.Timestamp(date), int(n)
+    return None
+
+
+def evaluate_with_snapshots(
+    purchase_history: pd.DataFrame,
+    ref_currency: str,
+    path: str,
+    quotes: QuoteCache = DEFAULT_QUOTES,
+    verbose: bool = True,
+    dtype=np.float64,
+) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """`evaluate_portfolio`, resumed from the snapshot saved at `path` by a previous run.
+
+    A snapshot keeps the cumulative holdings, invested cash and value of each asset
+    up to monthly checkpoints, each with the hash of the transactions it covers. Only
+    the transactions and dates after the last checkpoint still matching the history
+    are valued, so that editing a transaction only invalidates the checkpoints after
+    it. The snapshot is then extended up to the last settled month.
+    """
+    history = purchase_history.sort_values("Date", kind="stable", ignore_index=True)
+    row_hashes = hash_pandas_object(history[HASHED_COLUMNS], index=False).to_numpy()
+    transaction_dates = history["Date"].to_numpy(dtype="datetime64[ns]")
+    dates = timeline(history)
+
+    snapshot = _load(path)
+    valid = None
+    if snapshot is not None and str(snapshot["ref_currency"]) == ref_currency:
+        valid = _last_valid(snapshot, transaction_dates, row_hashes)
+
+    # Value the transactions and dates after the checkpoint only
+    checkpoint, n_rows = valid if valid is not None else (None, 0)
+    new = history.iloc[n_rows:].copy()
+    new_dates = dates if checkpoint is None else dates[dates > checkpoint]
+    PROFILER.count("rows_processed", len(new))
+    price_transactions(new, ref_currency, quotes, verbose=verbose)
+    holdings = holdings_matrix(new, new_dates)
+    invested = holdings_matrix(new, new_dates, column="invested_cash")
+    units = new.groupby("yf_name", observed=True)["Unit"].first().astype(str)
+
+    if checkpoint is not None:
+        # Resume from the holdings and invested cash at the checkpoint
+        kept = snapshot["dates"] <= np.datetime64(checkpoint)
+        tickers = snapshot["tickers"].tolist()
+        old = {
+            name: pd.DataFrame(
+                snapshot[name][kept],
+                index=pd.DatetimeIndex(snapshot["dates"][kept]),
+                columns=tickers,
+            )
+            for name in ("holdings", "invested", "values")
+        }
+        columns = list(dict.fromkeys(tickers + holdings.columns.tolist()))
+        holdings = holdings.reindex(columns=columns, fill_value=0.0)
+        invested = invested.reindex(columns=columns, fill_value=0.0)
+        holdings += old["holdings"].iloc[-1].reindex(columns, fill_value=0.0)
+        invested += old["invested"].iloc[-1].reindex(columns, fill_value=0.0)
+        units = pd.Series(snapshot["units"], index=tickers).combine_first(units)
+
+    values = value_holdings(
+        holdings, units, ref_currency, quotes, verbose=verbose, dtype=dtype
+    )
+    if checkpoint is not None:
+        holdings, invested, values = (
+            pd.concat([old[name].reindex(columns=columns, fill_value=0.0), frame])
+            for name, frame in (
+                ("holdings", holdings),
+                ("invested", invested),
+                ("values", values),
+            )
+        )
+
+    # Checkpoint the last date of each settled month
+    cutoff = pd.Timestamp.today().normalize() - pd.Timedelta(days=SETTLE_DAYS)
+    settled = dates[dates <= cutoff]
+    if len(settled):
+        months = settled.to_period("M").asi8
+        cp_dates = settled[np.r_[months[1:] != months[:-1], True]]
+        cp_rows = np.searchsorted(transaction_dates, cp_dates.to_numpy(), side="right")
+        kept = dates <= cp_dates[-1]
+        tickers = holdings.columns.tolist()
+        _save(
+            path,
+            ref_currency=np.array(ref_currency),
+            dates=dates[kept].to_numpy(dtype="datetime64[ns]"),
+            tickers=np.array(tickers, dtype=str),
+            units=units[tickers].to_numpy(dtype=str),
+            holdings=holdings.to_numpy()[kept],
+            invested=invested.to_numpy()[kept],
+            values=values.to_numpy()[kept],
+            cp_dates=cp_dates.to_numpy(dtype="datetime64[ns]"),
+            cp_rows=cp_rows,
+            cp_hashes=np.array(prefix_hashes(row_hashes, cp_rows), dtype=str),
+        )
+
+    return summarize(invested, values), invested, values
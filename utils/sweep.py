@@ -0,0 +1,176 @@
+import heapq
+import itertools
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .compact import PriceMatrix
+from .risk import TRADING_DAYS, returns_matrix
+
+METRICS = ["annual_return", "annual_volatility", "sharpe", "max_drawdown"]
+
+# Daily returns matrix, memory-mapped once by each worker of the pool
+_returns = None
+
+
+def weight_grid(n: int, step: float) -> np.ndarray:
+    """Every vector of `n` weights multiple of `step` and summing to 1 (stars and bars)"""
+    units = int(round(1 / step))
+    if n == 1:
+        return np.ones((1, 1))
+    grid = []
+    for bars in itertools.combinations(range(units + n - 1), n - 1):
+        edges = np.array((-1,) + bars + (units + n - 1,))
+        grid.append(np.diff(edges) - 1)
+    return np.array(grid, dtype=float) / units
+
+
+def candidate_weights(
+    portfolio_structure: pd.DataFrame,
+    step: float = 0.1,
+    max_candidates: int = 10_000,
+    seed: int = 0,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Candidate `p_L1`/`p_L2` structures of a formatted ideal portfolio.
+
+    Each L1 category and each L2 sub-category (within its L1) is given a weight on a
+    grid of `step`, the leaves keeping their current share of their (L1, L2) node. The
+    product of the grids is sampled down to `max_candidates` candidates if needed.
+    Returns the candidate weights of each asset (candidates x yf_name) and the
+    candidate `p_L1`/`p_L2` (in %).
+    """
+    leaves = portfolio_structure.dropna(subset=["yf_name"]).reset_index(drop=True)
+    l1 = leaves["L1"].astype(str)
+    l2 = leaves["L2"].astype(str) if "L2" in leaves else pd.Series("nan", leaves.index)
+    l1_names = l1.unique().tolist()
+
+    # Share of each leaf within its (L1, L2) node, and share of each node in its L1
+    node = l1 + "/" + l2
+    within = leaves["p_overall"] / leaves.groupby(node)["p_overall"].transform("sum")
+    grids = [weight_grid(len(l1_names), step)]
+    columns = [[f"p_L1[{c}]" for c in l1_names]]
+    children = {}
+    for c in l1_names:
+        names = [n for n in node[l1 == c].unique() if not n.endswith("/nan")]
+        if len(names) > 1:
+            children[c] = names
+            grids.append(weight_grid(len(names), step))
+            columns.append([f"p_L2[{n}]" for n in names])
+
+    # Cartesian product of the grids, sampled if too large
+    sizes = [len(g) for g in grids]
+    n_candidates = int(np.prod(sizes, dtype=float))
+    if n_candidates <= max_candidates:
+        picks = np.indices(sizes).reshape(len(sizes), -1)
+    else:
+        rng = np.random.default_rng(seed)
+        picks = np.vstack([rng.integers(0, size, max_candidates) for size in sizes])
+    chosen = [g[p] for g, p in zip(grids, picks)]
+    structures = pd.DataFrame(np.hstack(chosen) * 100, columns=sum(columns, []))
+
+    # Weight of each leaf: p_L1 x p_L2 x share within its node
+    leaf_weights = chosen[0][:, [l1_names.index(c) for c in l1]] * within.to_numpy()
+    for grid, c in zip(chosen[1:], children):
+        for i, n in enumerate(children[c]):
+            leaf_weights[:, (node == n).to_numpy()] *= grid[:, [i]]
+
+    assets = pd.DataFrame(leaf_weights, columns=leaves["yf_name"])
+    assets = assets.T.groupby(level=0).sum().T
+
+    # Keep the first of the candidates with the same weight for every asset
+    _, first = np.unique(assets.to_numpy().round(12), axis=0, return_index=True)
+    first = np.sort(first)
+    assets = assets.iloc[first].reset_index(drop=True)
+    structures = structures.iloc[first].reset_index(drop=True)
+    return assets, structures
+
+
+def _init_worker(path: str):
+    global _returns
+    _returns = PriceMatrix.open(path).values
+
+
+def evaluate_weights(returns: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """Metrics (columns of METRICS) of portfolios kept at each row of `weights`.
+
+    All candidates are evaluated at once: their daily returns are a single
+    (dates x assets) @ (assets x candidates) product.
+    """
+    portfolio_returns = returns @ weights.T
+    annual_return = portfolio_returns.mean(axis=0) * TRADING_DAYS
+    annual_volatility = portfolio_returns.std(axis=0) * np.sqrt(TRADING_DAYS)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sharpe = annual_return / annual_volatility
+    growth = np.cumprod(1 + portfolio_returns, axis=0)
+    max_drawdown = (1 - growth / np.maximum.accumulate(growth, axis=0)).max(axis=0)
+    return np.column_stack([annual_return, annual_volatility, sharpe, max_drawdown])
+
+
+def _evaluate_chunk(args: tuple[int, np.ndarray]) -> tuple[int, np.ndarray]:
+    first, weights = args
+    return first, evaluate_weights(_returns, weights)
+
+
+def sweep(
+    prices: pd.DataFrame,
+    candidates: pd.DataFrame,
+    structures: pd.DataFrame,
+    output: str,
+    rank_by: str = "sharpe",
+    top: int = 100,
+    chunk_size: int = 512,
+    max_workers: int = None,
+) -> pd.DataFrame:
+    """Evaluate every candidate weighting over the `prices` (dates x assets).
+
+    The daily returns are written once to a memory-mapped file shared by the worker
+    processes, which evaluate the candidates by chunks. The results are appended to
+    `output` as they arrive, and the `top` candidates ranked by `rank_by` are returned
+    and written next to it.
+    """
+    weights = candidates.reindex(columns=prices.columns, fill_value=0).to_numpy()
+    returns = returns_matrix(prices)
+
+    rank = METRICS.index(rank_by)
+    # The lower the volatility or the drawdown, the better
+    sign = -1 if rank_by in ("annual_volatility", "max_drawdown") else 1
+    best, kept = [], {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "returns")
+        PriceMatrix(returns.index, returns.columns, returns.to_numpy()).save(path)
+        chunks = [
+            (first, weights[first : first + chunk_size])
+            for first in range(0, len(weights), chunk_size)
+        ]
+        with (
+            ProcessPoolExecutor(
+                max_workers=max_workers, initializer=_init_worker, initargs=(path,)
+            ) as pool,
+            open(output, "w") as f,
+        ):
+            header = True
+            for first, metrics in pool.map(_evaluate_chunk, chunks):
+                results = structures.iloc[first : first + len(metrics)].copy()
+                results[METRICS] = metrics
+                results.to_csv(f, header=header, index_label="candidate")
+                header = False
+                # Only the best candidates of the chunk can enter the ranking
+                scores = np.nan_to_num(sign * metrics[:, rank], nan=-np.inf)
+                for i in np.argsort(-scores)[:top]:
+                    item = (scores[i], first + int(i))
+                    kept[item[1]] = metrics[i]
+                    if len(best) < top:
+                        heapq.heappush(best, item)
+                        continue
+                    dropped = heapq.heappushpop(best, item)
+                    del kept[dropped[1]]
+
+    order = [i for _, i in sorted(best, reverse=True)]
+    ranked = structures.iloc[order].copy()
+    ranked[METRICS] = np.array([kept[i] for i in order]).reshape(-1, len(METRICS))
+    ranked.index.name = "candidate"
+    ranked.to_csv(os.path.splitext(output)[0] + "_top.csv")
+    return ranked
@@ -0,0 +1,172 @@
+import numpy as np
+import pandas as pd
+
+from .fx import fx_matrices, fx_matrix, fx_rates, fx_vectors
+from .profiler import PROFILER
+from .quote_cache import DEFAULT_QUOTES, QuoteCache
+
+
+def timeline(purchase_history: pd.DataFrame) -> pd.DatetimeIndex:
+    """Dates of the transactions and every Monday since the first one until today"""
+    first_date = purchase_history["Date"].min()
+    last_date = pd.Timestamp.today().normalize()
+    mondays = pd.date_range(start=first_date, end=last_date, freq="W-MON")
+    return pd.DatetimeIndex(purchase_history["Date"].unique()).union(mondays)
+
+
+def holdings_matrix(
+    purchase_history: pd.DataFrame, dates: pd.DatetimeIndex, column: str = "Quantity"
+) -> pd.DataFrame:
+    """Cumulative sum of `column` per asset (columns) at each of `dates` (rows)"""
+    flows = purchase_history.pivot_table(
+        index="Date",
+        columns="yf_name",
+        values=column,
+        aggfunc="sum",
+        fill_value=0.0,
+        observed=True,
+    )
+    return flows.reindex(dates, fill_value=0.0).cumsum()
+
+
+def price_transactions(
+    purchase_history: pd.DataFrame,
+    ref_currency: str,
+    quotes: QuoteCache = DEFAULT_QUOTES,
+    verbose: bool = True,
+) -> None:
+    """Add the unit price, exchange rate and invested cash of each transaction"""
+    purchase_history["unit_price"] = quotes.quotes(
+        purchase_history["yf_name"], purchase_history["Date"], verbose=verbose
+    )
+    purchase_history["exchange_rate"] = fx_rates(
+        purchase_history["Unit"],
+        ref_currency,
+        purchase_history["Date"],
+        quotes=quotes,
+        verbose=verbose,
+    )
+    purchase_history["invested_cash"] = (
+        purchase_history["unit_price"]
+        * purchase_history["exchange_rate"]
+        * purchase_history["Quantity"]
+    )
+
+
+def value_holdings(
+    holdings: pd.DataFrame,
+    units: pd.Series,
+    ref_currency: str,
+    quotes: QuoteCache = DEFAULT_QUOTES,
+    verbose: bool = True,
+    dtype=np.float64,
+) -> pd.DataFrame:
+    """Value in `ref_currency` of the `holdings` (dates x assets), each asset being
+    quoted in its currency of `units`, as `dtype` (float32 halves the memory)"""
+    dates, tickers = holdings.index, holdings.columns.tolist()
+    prices = quotes.price_matrix(tickers, dates, verbose=verbose, dtype=dtype)
+    currencies, fx_columns = np.unique(
+        units[tickers].to_numpy(dtype=str), return_inverse=True
+    )
+    fx = fx_matrix(currencies.tolist(), ref_currency, dates, quotes, verbose=verbose)
+    # Multiplied in place, one contiguous column at a time, without temporary matrix
+    prices.values *= holdings.to_numpy()
+    for i, fx_column in enumerate(fx_columns):
+        prices.values[:, i] *= fx[:, fx_column]
+    return prices.frame()
+
+
+def summarize(invested: pd.DataFrame, values: pd.DataFrame) -> pd.DataFrame:
+    """Invested cash and value of the whole portfolio at each date"""
+    return pd.DataFrame(
+        {
+            "Date": values.index,
+            "invested_cash": invested.sum(axis=1).to_numpy(),
+            "portfolio_value": values.sum(axis=1).to_numpy(),
+        }
+    )
+
+
+def evaluate_portfolio(
+    purchase_history: pd.DataFrame,
+    ref_currency: str,
+    quotes: QuoteCache = DEFAULT_QUOTES,
+    verbose: bool = True,
+    dtype=np.float64,
+) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """Value the portfolio at every date of its `timeline`, in one pass.
+
+    The (dates x assets) holdings matrix is multiplied by the aligned price and
+    exchange rate matrices (of `dtype`), instead of rebuilding the breakdown at each
+    date. Returns the invested cash and value of the whole portfolio, then of each
+    asset.
+    """
+    PROFILER.count("rows_processed", len(purchase_history))
+
+    # Get the amount of cash invested PER POSITION, at the date of each transaction
+    price_transactions(purchase_history, ref_currency, quotes, verbose=verbose)
+
+    # Cumulative holdings and invested cash PER DATE and PER POSITION
+    dates = timeline(purchase_history)
+    holdings = holdings_matrix(purchase_history, dates)
+    invested = holdings_matrix(purchase_history, dates, column="invested_cash")
+
+    # Quote of each asset and exchange rate of its currency at each date
+    units = purchase_history.groupby("yf_name", observed=True)["Unit"].first()
+    values = value_holdings(
+        holdings, units, ref_currency, quotes, verbose=verbose, dtype=dtype
+    )
+    return summarize(invested, values), invested, values
+
+
+def evaluate_currencies(
+    purchase_history: pd.DataFrame,
+    ref_currencies: list[str],
+    quotes: QuoteCache = DEFAULT_QUOTES,
+    verbose: bool = True,
+    dtype=np.float64,
+) -> pd.DataFrame:
+    """`evaluate_portfolio` in each of `ref_currencies`, in one pass.
+
+    The quotes and holdings are aligned once in the currency of each asset, only the
+    exchange rates being computed for each reference currency. Returns the invested
+    cash and value of the whole portfolio in each currency, as columns
+    `invested_cash_<currency>` and `portfolio_value_<currency>`.
+    """
+    PROFILER.count("rows_processed", len(purchase_history))
+
+    # Cost of each transaction in the currency of the asset, and in each reference
+    unit_price = quotes.quotes(
+        purchase_history["yf_name"], purchase_history["Date"], verbose=verbose
+    )
+    native_cash = unit_price * purchase_history["Quantity"].to_numpy()
+    rates = fx_vectors(
+        purchase_history["Unit"],
+        ref_currencies,
+        purchase_history["Date"],
+        quotes=quotes,
+        verbose=verbose,
+    )
+
+    # Holdings valued in the currency of each asset, at each date
+    dates = timeline(purchase_history)
+    holdings = holdings_matrix(purchase_history, dates)
+    tickers = holdings.columns.tolist()
+    units = purchase_history.groupby("yf_name", observed=True)["Unit"].first()
+    native_values = quotes.price_matrix(tickers, dates, verbose=verbose, dtype=dtype)
+    native_values.values *= holdings.to_numpy()
+    currencies, fx_columns = np.unique(
+        units[tickers].to_numpy(dtype=str), return_inverse=True
+    )
+    fx = fx_matrices(currencies.tolist(), ref_currencies, dates, quotes, verbose)
+
+    summary = pd.DataFrame({"Date": dates})
+    flows = purchase_history[["Date", "yf_name"]].copy()
+    for i, currency in enumerate(ref_currencies):
+        flows["invested_cash"] = native_cash * rates[:, i]
+        invested = holdings_matrix(flows, dates, column="invested_cash")
+        summary[f"invested_cash_{currency}"] = invested.sum(axis=1).to_numpy()
+        summary[f"portfolio_value_{currency}"] = (
+            native_values.values * fx[i][:, fx_columns]
+        ).sum(axis=1)
+    return summary
@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+
+from .fx import fx_rates
+from .history import fold_holdings
+from .orders import CASH_LOT, optimize_orders
+from .profiler import PROFILER
+from .quote_cache import DEFAULT_QUOTES, QuoteCache
+
+
+def _assets(
+    purchase_history: pd.DataFrame, structures: dict[str, pd.DataFrame]
+) -> pd.DataFrame:
+    """Quantity held, currency, lot size and desired weight in each target of every
+    asset held or in one of the `structures`. `purchase_history` may also be its
+    holdings only (`read_holdings`)"""
+    held = fold_holdings([purchase_history]).astype({"yf_name": object, "Unit": object})
+    held = held.groupby("yf_name").agg(
+        Unit=("Unit", "first"), Quantity=("Quantity", "sum")
+    )
+    ideal = pd.concat(structures.values()).dropna(subset=["yf_name"])
+    lots = ideal["Lot"] if "Lot" in ideal else pd.Series(np.nan, index=ideal.index)
+    ideal = (
+        ideal.assign(Lot=lots)
+        .groupby("yf_name")
+        .agg(Unit=("Unit", "first"), Lot=("Lot", "first"))
+    )
+    assets = held.combine_first(ideal)
+    assets["Quantity"] = assets["Quantity"].fillna(0.0)
+    for name, structure in structures.items():
+        p_desired = structure.groupby("yf_name")["p_overall"].sum()
+        assets[name] = p_desired.reindex(assets.index, fill_value=0.0)
+    return assets
+
+
+def what_if(
+    purchase_history: pd.DataFrame,
+    structures: dict[str, pd.DataFrame],
+    cash,
+    ref_currency: str,
+    quotes: QuoteCache = DEFAULT_QUOTES,
+    min_order: float = 0.0,
+    fee_fixed: float = 0.0,
+    fee_rate: float = 0.0,
+    allow_sell: bool = True,
+    max_turnover: float = None,
+    verbose: bool = True,
+) -> pd.DataFrame:
+    """Breakdown and orders of the portfolio for every pair of a `cash` influx and an
+    ideal portfolio of `structures` (name: formatted ideal portfolio).
+
+    The assets are priced once, then all the scenarios are solved at once as
+    (scenarios x assets) arrays, as `provide_breakdown_existing_assets` and
+    `get_list_of_orders` would for each of them. As with `--investment`, a negative
+    cash influx is ignored. Returns one row per scenario and asset held or desired.
+    """
+    assets = _assets(purchase_history, structures)
+    tickers = assets.index.to_numpy(dtype=object)
+    price = quotes.quotes(tickers, verbose=verbose) * fx_rates(
+        assets["Unit"], ref_currency, quotes=quotes, verbose=verbose
+    )
+    quantity = assets["Quantity"].to_numpy(dtype=float)
+
+    # Scenarios: every cash influx for each target, in this order
+    names = list(structures)
+    cash = np.maximum(np.atleast_1d(np.asarray(cash, dtype=float)), 0)
+    n_cash = len(cash)
+    targets = np.repeat(assets[names].to_numpy(dtype=float).T, n_cash, axis=0)
+    scenario_cash = np.tile(cash, len(names))
+    PROFILER.count("whatif_scenarios", len(scenario_cash))
+
+    # Breakdown and fractional orders, the cash influx being a position of the total
+    position = quantity * price
+    total = position.sum() + scenario_cash
+    p_real = 100 * position / total[:, None]
+    order_value = (targets - p_real) * total[:, None] / 100
+    with np.errstate(divide="ignore", invalid="ignore"):
+        order_shares = order_value / price
+
+    # Executable orders, moving cash in and out of the cash lines is free
+    is_cash = tickers == "--"
+    lot_size = np.where(is_cash, CASH_LOT, assets["Lot"].fillna(1).replace(0, 1))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weights = np.nan_to_num(targets / targets.sum(axis=1, keepdims=True))
+    shares, cash_left, fees = optimize_orders(
+        quantity,
+        price,
+        weights,
+        scenario_cash,
+        lot_size,
+        min_order=min_order,
+        fee_fixed=np.where(is_cash, 0, fee_fixed),
+        fee_rate=np.where(is_cash, 0, fee_rate),
+        allow_sell=allow_sell | is_cash,
+        max_turnover=max_turnover,
+    )
+
+    n_assets = len(tickers)
+    result = pd.DataFrame(
+        {
+            "target": np.repeat(np.repeat(names, n_cash), n_assets),
+            "cash": np.repeat(scenario_cash, n_assets),
+            "yf_name": np.tile(tickers, len(scenario_cash)),
+            "p_real": p_real.ravel(),
+            "p_desired": targets.ravel(),
+            f"order_in_{ref_currency}": order_value.ravel(),
+            "order_in_shares": order_shares.ravel(),
+            "executable_shares": shares.ravel(),
+            "fees": np.repeat(fees, n_assets),
+            "cash_left": np.repeat(cash_left, n_assets),
+        }
+    )
+    # Drop the assets neither held nor desired in a scenario
+    relevant = (np.tile(quantity, len(scenario_cash)) != 0) | (targets.ravel() != 0)
+    return result[relevant].reset_index(drop=True)